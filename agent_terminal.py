@@ -11,27 +11,54 @@ A terminal-based AI assistant that works as an agent, capable of:
 import os
 import sys
 import re
+import io
 import json
 import time
+import mmap
+import hashlib
+import functools
+from array import array
+from collections import deque, OrderedDict
 import shlex
+import stat
 import platform
 import subprocess
-import yaml
+import threading
+import queue
+import selectors
+import locale
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
 import random
-from datetime import datetime
-from typing import List, Dict, Optional, Tuple, Any, Union, Set
+import atexit
+from datetime import timedelta
+from typing import List, Dict, Optional, Tuple, Any, Union, Set, NamedTuple, Deque, Iterator
 from dotenv import load_dotenv
 
-# For colorized output
+# Line editing with history search for interactive input
 try:
-    from rich.console import Console
-    from rich.panel import Panel
-    from rich.progress import Progress
-    from rich.table import Table
-    from rich.syntax import Syntax
-    HAS_RICH = True
+    from prompt_toolkit import PromptSession
+    from prompt_toolkit.history import InMemoryHistory
+    HAS_PROMPT_TOOLKIT = True
 except ImportError:
-    HAS_RICH = False
+    HAS_PROMPT_TOOLKIT = False
+
+# For table output; rich is only imported the first time it is needed
+RICH = None
+
+def get_rich() -> Dict[str, Any]:
+    """Import rich on first use and cache the classes we need (empty if unavailable)"""
+    global RICH
+    if RICH is None:
+        try:
+            from rich.console import Console
+            from rich.table import Table
+            # One console is shared by every table printed
+            RICH = {"Console": Console, "Table": Table, "console": Console()}
+        except ImportError:
+            RICH = {}
+    return RICH
 
 try:
     from colorama import Fore, Style, init as colorama_init
@@ -40,12 +67,41 @@ try:
 except ImportError:
     HAS_COLORAMA = False
     class DummyFore:
-        RED = GREEN = YELLOW = CYAN = BLUE = ''
+        RED = GREEN = YELLOW = CYAN = BLUE = WHITE = ''
     class DummyStyle:
         RESET_ALL = ''
     Fore = DummyFore()
     Style = DummyStyle()
 
+# Colored fragments reused by the listing commands
+STATUS_SUCCESS = f"{Fore.GREEN}Success{Style.RESET_ALL}"
+STATUS_FAILED = f"{Fore.RED}Failed ({{}}){Style.RESET_ALL}"
+MOVED_LINE = f"{Fore.GREEN}Moved {{}} to {{}}{Style.RESET_ALL}"
+
+# Platform details resolved once at import
+IS_WINDOWS = sys.platform == "win32"
+OS_NAME = platform.system()
+OS_RELEASE = platform.release()
+PLATFORM_STR = f"{OS_NAME} {OS_RELEASE}"
+
+# Per-user folder for state that outlives a session, independent of the working directory
+if IS_WINDOWS:
+    USER_DATA_DIR = os.path.join(os.environ.get("LOCALAPPDATA", os.path.expanduser("~")), "GeminiTerminalAssistant")
+else:
+    USER_DATA_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "gemini-terminal-assistant")
+
+# Windows API access for drive information and directory listing
+if IS_WINDOWS:
+    import ctypes
+    from ctypes import wintypes
+    _kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+
+# Sampling window used when measuring CPU usage
+MONITOR_SAMPLE_INTERVAL = 0.5
+
+# Gemini model used for all requests
+MODEL_NAME = 'gemini-2.0-flash'
+
 # Initialize variables that will be set in init_gemini
 MODEL = None
 SILENT_MODE = False
@@ -71,10 +127,112 @@ def init_gemini(silent=False):
         print("Configuring Gemini API...")
     import google.generativeai as genai
     genai.configure(api_key=GOOGLE_API_KEY)
-    MODEL = genai.GenerativeModel('gemini-2.0-flash')  # Use Flash for faster responses
+    MODEL = genai.GenerativeModel(MODEL_NAME)  # Use Flash for faster responses
+
+class PromptCache:
+    """LRU cache of model responses keyed by prompt hash, with entries expiring after a TTL"""
+    
+    def __init__(self, capacity: int = 128, ttl: float = 300):
+        self.capacity = capacity
+        self.ttl = ttl
+        # sha256(prompt) -> (expiry as epoch seconds, response text), oldest first
+        self.entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self.lock = threading.Lock()
+        # Set when an entry is added, so an unchanged cache is not rewritten on exit
+        self.dirty = False
+        # File the cache was loaded from and is saved back to
+        self.path: Optional[str] = None
+    
+    @staticmethod
+    def key(prompt: str) -> str:
+        """Get the cache key for a prompt"""
+        return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    
+    def get(self, prompt: str) -> Optional[str]:
+        """Get the cached response for a prompt, or None if missing or expired"""
+        key = self.key(prompt)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+    
+    def put(self, prompt: str, response: str):
+        """Store a response, evicting the least recently used entry when full"""
+        key = self.key(prompt)
+        with self.lock:
+            self.entries[key] = (time.time() + self.ttl, response)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+            self.dirty = True
+    
+    def load(self, path: str):
+        """Load unexpired entries saved by an earlier session, and save back to the same file"""
+        self.path = path
+        try:
+            with open(path, 'rb') as f:
+                saved = _json_loads(f.read())
+        except (OSError, ValueError):
+            return
+        if not isinstance(saved, list):
+            return
+        now = time.time()
+        with self.lock:
+            # Rows that don't have the saved shape are skipped rather than trusted
+            for row in saved:
+                if not (isinstance(row, list) and len(row) == 3):
+                    continue
+                key, expiry, response = row
+                if isinstance(key, str) and isinstance(expiry, (int, float)) and isinstance(response, str) and expiry > now:
+                    self.entries[key] = (expiry, response)
+    
+    def save(self):
+        """Write the unexpired entries to the loaded file so they survive a restart"""
+        path = self.path
+        now = time.time()
+        with self.lock:
+            if path is None or not self.dirty:
+                return
+            saved = [[key, expiry, response] for key, (expiry, response) in self.entries.items() if expiry > now]
+            self.dirty = False
+        try:
+            # Write beside the old file and swap it in, so an interrupted save never truncates it
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(_json_dumps(saved))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error saving prompt cache: {str(e)}")
+
+# Task plans for the same task, directory and history tail recur within and across sessions.
+# Verdicts, generated commands and questions are sampled and must not be replayed, so only
+# planning goes through this cache.
+PROMPT_CACHE = PromptCache()
+# Saved at exit so one-shot runs and interrupted sessions keep their plans too
+atexit.register(PROMPT_CACHE.save)
+
+def generate_text(prompt: str, cache: bool = False) -> str:
+    """Get the model's text response for a prompt, reusing a recent response to the same prompt if cache is set"""
+    text = PROMPT_CACHE.get(prompt) if cache else None
+    if text is None:
+        text = MODEL.generate_content(prompt).text
+        if cache:
+            PROMPT_CACHE.put(prompt, text)
+    return text
+
+def stream_text(prompt: str) -> Iterator[str]:
+    """Yield the model's response to a prompt in chunks as they are generated"""
+    for chunk in MODEL.generate_content(prompt, stream=True):
+        yield chunk.text
 
 # Import MCP server
-from mcp_server import mcp
+from mcp_server import get_mcp, EXT_TO_FOLDER, SORT_FOLDERS
 
 # Import agent utilities if available
 try:
@@ -83,15 +241,780 @@ try:
 except ImportError:
     HAS_AGENT_UTILS = False
 
+# Faster JSON encoding/decoding (history file, model responses) when orjson is available
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+def _json_dumps(obj: Any) -> bytes:
+    """Serialize an object to a single newline-terminated JSON line"""
+    if HAS_ORJSON:
+        return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE | orjson.OPT_NAIVE_UTC)
+    return (json.dumps(obj) + "\n").encode("utf-8")
+
+def _json_loads(data: Union[bytes, str]) -> Any:
+    """Parse JSON from bytes or text"""
+    if HAS_ORJSON:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def read_history_file(path: str) -> Tuple[List[Any], bool]:
+    """Read a history file, returning its entries and whether the file needs rewriting as clean JSON Lines"""
+    entries: List[Any] = []
+    with open(path, 'rb') as f:
+        # mmap cannot map an empty file
+        if os.fstat(f.fileno()).st_size == 0:
+            return entries, False
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # Older versions saved the whole history as one JSON array
+            if mm[:64].lstrip().startswith(b"["):
+                try:
+                    legacy = _json_loads(mm[:])
+                except ValueError:
+                    legacy = None
+                if isinstance(legacy, list):
+                    return legacy, True
+            # A torn or malformed line only costs that entry
+            skipped = 0
+            for line in iter(mm.readline, b""):
+                if line.strip():
+                    try:
+                        entries.append(_json_loads(line))
+                    except ValueError:
+                        skipped += 1
+            # New lines must not be appended to a damaged or unterminated last line
+            return entries, skipped > 0 or mm[-1:] != b"\n"
+
+# Input classification patterns, compiled once at import time
+CONVERSATIONAL_PATTERNS = [
+    r'^hi\b',
+    r'^hello\b',
+    r'^hey\b',
+    r'how are you',
+    r'^what\'?s up',
+    r'^good morning',
+    r'^good afternoon',
+    r'^good evening',
+    r'^\?',
+    r'^who are you',
+    r'^tell me about yourself',
+    r'^what can you do'
+]
+
+MONITORING_PATTERNS = [
+    r'(show|display|check|monitor|get).*(cpu|processor|memory|ram|system).*(usage|performance|status|health)',
+    r'(cpu|memory|ram|system).*(usage|monitor|status|performance)',
+    r'(show|display|monitor).*(resource|usage|performance)',
+    r'real.?time.*(monitor|usage|performance|stats)',
+    r'how.*(much|many).*(cpu|memory|ram)'
+]
+
+# Task-related terms that should be processed as commands, not conversations
+TASK_TERMS = ('install', 'create', 'delete', 'find', 'run', 'show', 'list', 'make', 'exec',
+              'search', 'organize', 'copy', 'move', 'check', 'get', 'display', 'monitor',
+              'analyze', 'download', 'upload', 'convert', 'rename', 'backup')
+
+# Technical/system-specific terms that strongly indicate a command, not conversation
+TECHNICAL_TERMS = ('cpu', 'memory', 'ram', 'disk', 'drive', 'file', 'folder', 'directory',
+                   'process', 'system', 'network', 'port', 'usage', 'real-time', 'realtime',
+                   'performance', 'monitor', 'resource', 'task manager', 'log', 'service',
+                   'registry', 'database', 'hardware', 'software', 'driver', 'update')
+
+# Keyword categories detected with a single scan over the input, one bit each
+TERM_TASK = 1 << 0
+TERM_TECHNICAL = 1 << 1
+TERM_MONITOR = 1 << 2
+TERM_RESOURCE = 1 << 3
+TERM_LIVE = 1 << 4
+TERM_MONITOR_VERB = 1 << 5
+TERM_MONITOR_TARGET = 1 << 6
+TERM_MONITOR_METRIC = 1 << 7
+TERM_MONITOR_REQUEST = TERM_MONITOR_VERB | TERM_MONITOR_TARGET | TERM_MONITOR_METRIC
+TERM_CMDGEN_MONITOR = 1 << 8
+TERM_CMDGEN_RESOURCE = 1 << 9
+TERM_CMDGEN_LIVE = TERM_CMDGEN_MONITOR | TERM_CMDGEN_RESOURCE
+
+TERM_CATEGORIES = {
+    TERM_TASK: TASK_TERMS,
+    TERM_TECHNICAL: TECHNICAL_TERMS,
+    TERM_MONITOR: ("real-time", "realtime", "monitor", "live", "continuous"),
+    TERM_RESOURCE: ("cpu", "memory", "ram", "processor", "system", "resources", "performance"),
+    TERM_LIVE: ("real-time", "realtime", "continuous", "live"),
+    TERM_MONITOR_VERB: ("show", "display", "monitor"),
+    TERM_MONITOR_TARGET: ("cpu", "processor", "memory", "ram", "resource", "system"),
+    TERM_MONITOR_METRIC: ("usage", "performance", "status", "real-time", "realtime"),
+    # Live monitoring requests that command generation answers with fixed commands
+    TERM_CMDGEN_MONITOR: ("real-time", "monitor"),
+    TERM_CMDGEN_RESOURCE: ("cpu", "memory", "system")
+}
+
+CONVERSATIONAL_RE = re.compile("|".join(CONVERSATIONAL_PATTERNS))
+MONITORING_RE = re.compile("|".join(MONITORING_PATTERNS))
+
+def _build_term_flags() -> Dict[str, int]:
+    """Map each term to the combined bits of every category it belongs to"""
+    term_flags: Dict[str, int] = {}
+    for flag, terms in TERM_CATEGORIES.items():
+        for term in terms:
+            term_flags[term] = term_flags.get(term, 0) | flag
+    return term_flags
+
+TERM_TO_FLAGS = _build_term_flags()
+
+def _build_term_automaton():
+    """Build an Aho-Corasick automaton mapping each term to its category bits"""
+    automaton = ahocorasick.Automaton()
+    for term, flags in TERM_TO_FLAGS.items():
+        automaton.add_word(term, flags)
+    automaton.make_automaton()
+    return automaton
+
+# Use pyahocorasick if available, otherwise one precompiled regex per category
+try:
+    import ahocorasick
+    TERM_AUTOMATON = _build_term_automaton()
+    HAS_AHOCORASICK = True
+except ImportError:
+    TERM_AUTOMATON = None
+    HAS_AHOCORASICK = False
+    TERM_CATEGORY_RES = [
+        (flag, re.compile("|".join(map(re.escape, terms))))
+        for flag, terms in TERM_CATEGORIES.items()
+    ]
+
+def match_term_flags(text_lower: str) -> int:
+    """Get the OR of the category bits of every keyword occurring in lowercased text"""
+    flags = 0
+    if HAS_AHOCORASICK:
+        for _, term_flags in TERM_AUTOMATON.iter(text_lower):
+            flags |= term_flags
+        return flags
+    for flag, pattern in TERM_CATEGORY_RES:
+        if pattern.search(text_lower):
+            flags |= flag
+    return flags
+
+class ClassifiedInput(NamedTuple):
+    """Result of analysing one line of user input"""
+    text_lower: str
+    flags: int
+    is_monitoring: bool
+    is_conversational: bool
+    is_live: bool
+
+# Repeated inputs ("hi", "show cpu usage", ...) are common in a session, so results are memoized
+@functools.lru_cache(maxsize=512)
+def classify_input(text: str) -> ClassifiedInput:
+    """Lowercase and scan user input once, deriving every classification flag from it"""
+    text_lower = text.lower()
+    flags = match_term_flags(text_lower)
+    monitoring_match = MONITORING_RE.search(text_lower) is not None
+    
+    # Comprehensive check for various monitoring command formats
+    is_monitoring = monitoring_match or (flags & TERM_MONITOR_REQUEST) == TERM_MONITOR_REQUEST
+    
+    # Conversational patterns win; technical, task and monitoring terms mean a command;
+    # otherwise very short inputs (1-3 words) are treated as conversation
+    if CONVERSATIONAL_RE.search(text_lower):
+        is_conversational = True
+    elif flags & (TERM_TECHNICAL | TERM_TASK) or monitoring_match:
+        is_conversational = False
+    else:
+        is_conversational = len(text_lower.split()) <= 3
+    
+    return ClassifiedInput(text_lower, flags, is_monitoring, is_conversational,
+                           bool(flags & TERM_LIVE))
+
+# Patterns for cleaning up and parsing model responses
+_CODE_FENCE_OPEN_RE = re.compile(r'```(?:powershell|sh|bash|cmd|bat|shell)?\n')
+_CODE_FENCE_RE = re.compile(r'```')
+_SHELL_PROMPT_RE = re.compile(r'^[>#$] ')
+# Lines of model output starting with these are markdown or explanations rather than commands
+_SKIP_PREFIXES = ('#', '*', '-', 'Note', 'For', 'The', 'This', 'To ', 'You can')
+# Explanation phrases that can appear anywhere in a line
+_SKIP_SUBSTRING_RE = re.compile(r'Note:|This command|Use this')
+# Cmdlet syntax that marks a command as PowerShell
+_PS_CUE_RE = re.compile(r'Get-|Set-|\$_|Where-Object')
+# Commands already wrapped in a PowerShell invocation
+_PS_PREFIX_RE = re.compile(r'powershell(?:\.exe)? -Command')
+
+def clean_command_lines(lines: List[str]) -> List[str]:
+    """Keep only the lines of model output that look like commands, wrapping bare PowerShell on Windows"""
+    commands = []
+    for line in lines:
+        line = line.strip()
+        # Skip blank lines, markdown headings, bullet points and explanations
+        if not line or line.startswith(_SKIP_PREFIXES) or _SKIP_SUBSTRING_RE.search(line):
+            continue
+        
+        # Remove any remaining markdown or non-command elements
+        line = _SHELL_PROMPT_RE.sub('', line)
+        if not line.split():
+            continue
+        
+        # If it's a PowerShell command but doesn't have the powershell -Command prefix
+        if IS_WINDOWS and _PS_CUE_RE.search(line) and not _PS_PREFIX_RE.match(line):
+            line = f'powershell -Command "{line}"'
+        commands.append(line)
+    return commands
+
+def iter_lines(chunks: Iterator[str]) -> Iterator[str]:
+    """Regroup streamed text chunks into complete lines (without the newline)"""
+    pending = ""
+    for chunk in chunks:
+        pending += chunk
+        end = pending.rfind('\n')
+        if end != -1:
+            yield from pending[:end].split('\n')
+            pending = pending[end + 1:]
+    if pending:
+        yield pending
+
+def prefetch(iterable: Iterator, maxsize: int = 0) -> Iterator:
+    """Drain an iterator on a background thread so producing items overlaps consuming them"""
+    items: queue.Queue = queue.Queue(maxsize)
+    done = object()
+    # Set when the consumer stops early, so the producer stops pulling from the iterable
+    stop = threading.Event()
+    
+    def produce():
+        try:
+            for item in iterable:
+                if stop.is_set():
+                    break
+                items.put((item, None))
+        except BaseException as e:
+            items.put((done, e))
+        else:
+            items.put((done, None))
+        finally:
+            close = getattr(iterable, "close", None)
+            if close is not None:
+                close()
+    
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            item, error = items.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+
+_JSON_DECODER = json.JSONDecoder()
+
+def parse_json_response(text: str) -> Any:
+    """Parse the first JSON object in a model response (inside a ```json fence if present)"""
+    # Most replies are a bare object, which the fast loader (orjson when installed) takes whole
+    stripped = text.strip()
+    if stripped.startswith('{') and stripped.endswith('}'):
+        try:
+            return _json_loads(stripped)
+        except ValueError:
+            pass
+    fence = text.find('```json')
+    start = text.find('{', fence if fence != -1 else 0)
+    # raw_decode stops at the end of the object, so trailing fences or prose are ignored;
+    # a brace that doesn't start valid JSON (e.g. in a preamble) moves on to the next one
+    while start != -1:
+        try:
+            return _JSON_DECODER.raw_decode(text, start)[0]
+        except ValueError:
+            start = text.find('{', start + 1)
+    return _json_loads(text)
+
+# Tasks that only check for an installation, and subtasks about a program's availability
+_CHECK_INSTALL_RE = re.compile(r'check if|verify if|see if|find out if|is installed', re.IGNORECASE)
+_PROGRAM_RE = re.compile(r'installed|accessible|available', re.IGNORECASE)
+
+# Most command output, in characters, quoted back to the model in follow-up prompts
+PROMPT_OUTPUT_LIMIT = 2048
+
+def tail_text(text: str, limit: int = PROMPT_OUTPUT_LIMIT) -> str:
+    """Get the last limit characters of text, marking the cut if anything was dropped"""
+    if len(text) <= limit:
+        return text
+    return "...(truncated)\n" + text[-limit:]
+
+# Trailing whitespace and line break of each line of command output
+_LINE_END_RE = re.compile(r'[^\S\r\n]*(?:\r\n|\r|\n)')
+
+# Patterns for the direct "find large files" command on Windows
+_LARGE_FILES_RE = re.compile(r'find.*files.*larger than.*MB', re.IGNORECASE)
+_SIZE_MB_RE = re.compile(r'(\d+)\s*MB', re.IGNORECASE)
+
+# A PowerShell one-liner whose whole script is one quoted argument; quotes and %VAR%
+# are excluded so the shell would have passed the script through unchanged
+_PS_ONE_LINER_RE = re.compile(r'^\s*powershell(?:\.exe)?((?: -(?:NoProfile|NonInteractive))*) -Command "([^"%]*)"\s*$', re.IGNORECASE)
+
+def powershell_argv(command: str) -> Optional[List[str]]:
+    """Get an argv that runs a quoted PowerShell one-liner without cmd.exe, or None"""
+    match = _PS_ONE_LINER_RE.match(command)
+    if not match:
+        return None
+    options = match.group(1).split()
+    # Profiles are not needed for one-off commands and can take hundreds of ms to load
+    if "-noprofile" not in match.group(1).lower():
+        options.insert(0, "-NoProfile")
+    return ["powershell", *options, "-Command", match.group(2)]
+
+# Home directory and common installation directories, resolved once per process
+_HOME = os.path.expanduser("~")
+COMMON_DIRS = {
+    "Program Files": os.environ.get("ProgramFiles", "C:\\Program Files"),
+    "Program Files (x86)": os.environ.get("ProgramFiles(x86)", "C:\\Program Files (x86)"),
+    "AppData": os.environ.get("APPDATA", os.path.join(_HOME, "AppData", "Roaming")),
+    "Local AppData": os.environ.get("LOCALAPPDATA", os.path.join(_HOME, "AppData", "Local")),
+    "Downloads": os.path.join(_HOME, "Downloads"),
+    "Desktop": os.path.join(_HOME, "Desktop"),
+    "Documents": os.path.join(_HOME, "Documents")
+}
+
+# GetDriveTypeW results; network and optical drives are slow to query and search
+DRIVE_TYPES = {2: "removable", 3: "fixed", 4: "network", 5: "cdrom", 6: "ramdisk"}
+LOCAL_DRIVE_TYPES = ("fixed", "ramdisk", "available")
+
+# Drive sizes change as files are written; re-read them at most this often
+DRIVE_INFO_TTL_SECONDS = 60
+
+def ttl_cache(seconds: float):
+    """Memoize a function's results, recomputing them once they are older than seconds"""
+    def decorator(func):
+        results: Dict[tuple, Tuple[float, Any]] = {}
+        
+        @functools.wraps(func)
+        def wrapper(*args):
+            now = time.monotonic()
+            cached = results.get(args)
+            if cached is None or now - cached[0] > seconds:
+                cached = results[args] = (now, func(*args))
+            return cached[1]
+        return wrapper
+    return decorator
+
+def _drive_type(drive: str) -> str:
+    """Get the kind of a Windows drive root, or "available" if it cannot be determined"""
+    try:
+        return DRIVE_TYPES.get(_kernel32.GetDriveTypeW(drive), "available")
+    except Exception:
+        return "available"
+
+def _disk_space(drive: str) -> Tuple[int, int]:
+    """Get (free bytes, total bytes) of a Windows drive with one GetDiskFreeSpaceExW call"""
+    total_bytes = ctypes.c_ulonglong()
+    free_bytes = ctypes.c_ulonglong()
+    if not _kernel32.GetDiskFreeSpaceExW(drive, None, ctypes.byref(total_bytes), ctypes.byref(free_bytes)):
+        raise ctypes.WinError(ctypes.get_last_error())
+    return free_bytes.value, total_bytes.value
+
+@ttl_cache(DRIVE_INFO_TTL_SECONDS)
+def get_drive_info() -> Dict:
+    """Get information about system drives and common installation directories (cached briefly)"""
+    drive_info = {}
+    try:
+        # Get all drives on Windows
+        if IS_WINDOWS:
+            # Drive letters come from a bitmask, bit 0 being A:
+            drive_mask = _kernel32.GetLogicalDrives()
+            drives = [f"{chr(65 + i)}:\\" for i in range(26) if drive_mask & (1 << i)]
+            for drive in drives:
+                drive_type = _drive_type(drive)
+                # Only local disks are asked for their size; the others can stall
+                if drive_type != "fixed":
+                    drive_info[drive] = {"type": drive_type}
+                    continue
+                try:
+                    # One call per drive returns both sizes as 64-bit byte counts
+                    free_space, total_space = _disk_space(drive)
+                    drive_info[drive] = {
+                        "type": drive_type,
+                        "free_space": free_space,
+                        "total_space": total_space
+                    }
+                except Exception:
+                    # If we can't get detailed info, just record the drive type
+                    drive_info[drive] = {"type": drive_type}
+    except Exception as e:
+        print(f"Warning: Could not get detailed drive information: {str(e)}")
+        # Fallback to basic drive detection
+        if IS_WINDOWS:
+            import string
+            for letter in string.ascii_uppercase:
+                drive = f"{letter}:\\"
+                if os.path.exists(drive):
+                    drive_info[drive] = {"type": _drive_type(drive)}
+    
+    drive_info["common_dirs"] = COMMON_DIRS
+    return drive_info
+
+@ttl_cache(DRIVE_INFO_TTL_SECONDS)
+def get_drive_info_text() -> str:
+    """Get the drive information as a flat key=value list for prompts (cached briefly)"""
+    lines = []
+    for name, info in get_drive_info().items():
+        if name == "common_dirs":
+            continue
+        if "total_space" in info:
+            lines.append(f"{name}={info['type']}, {info['free_space'] / 1e9:.1f}/{info['total_space'] / 1e9:.1f} GB free")
+        else:
+            lines.append(f"{name}={info['type']}")
+    lines.extend(f"{name}={path}" for name, path in COMMON_DIRS.items())
+    return "\n".join(lines)
+
+# Bounds for installation searches: how deep to descend and which directories never hold programs
+SCAN_MAX_DEPTH = 6
+# Matches kept per search root; the scan of a root ends early at its first executable
+MAX_LOCATIONS = 50
+SCAN_SKIP_DIRS = frozenset((
+    "$recycle.bin", "system volume information", "winsxs", "$windows.~bt", "$windows.~ws", "windows.old",
+    "node_modules", "__pycache__", ".git", ".svn", ".hg"
+))
+# Per-app data folders for Store apps; large and never hold the programs themselves
+SCAN_SKIP_PATHS = tuple(os.path.normcase(path) for path in (
+    os.path.join(COMMON_DIRS["Local AppData"], "Packages"),
+)) if IS_WINDOWS else ()
+
+# Directory listing through FindFirstFileExW on Windows: FindExInfoBasic skips the 8.3
+# short names and large fetches read more entries per call than os.scandir does
+if IS_WINDOWS:
+    FIND_EX_INFO_BASIC = 1
+    FIND_EX_SEARCH_NAME_MATCH = 0
+    FIND_FIRST_EX_LARGE_FETCH = 2
+    FILE_ATTRIBUTE_DIRECTORY = 0x10
+    FILE_ATTRIBUTE_REPARSE_POINT = 0x400
+    ERROR_FILE_NOT_FOUND = 2
+    INVALID_HANDLE_VALUE = ctypes.c_void_p(-1).value
+    
+    _FindFirstFileExW = _kernel32.FindFirstFileExW
+    _FindFirstFileExW.argtypes = [wintypes.LPCWSTR, ctypes.c_int, ctypes.POINTER(wintypes.WIN32_FIND_DATAW),
+                                  ctypes.c_int, ctypes.c_void_p, wintypes.DWORD]
+    _FindFirstFileExW.restype = wintypes.HANDLE
+    _FindNextFileW = _kernel32.FindNextFileW
+    _FindNextFileW.argtypes = [wintypes.HANDLE, ctypes.POINTER(wintypes.WIN32_FIND_DATAW)]
+    _FindNextFileW.restype = wintypes.BOOL
+    _FindClose = _kernel32.FindClose
+    _FindClose.argtypes = [wintypes.HANDLE]
+    _FindClose.restype = wintypes.BOOL
+
+def _win_scandir(path: str):
+    """Yield (name, attributes) for each entry of a Windows directory, without "." and ".." """
+    data = wintypes.WIN32_FIND_DATAW()
+    handle = _FindFirstFileExW(os.path.join(path, "*"), FIND_EX_INFO_BASIC, ctypes.byref(data),
+                               FIND_EX_SEARCH_NAME_MATCH, None, FIND_FIRST_EX_LARGE_FETCH)
+    if handle == INVALID_HANDLE_VALUE:
+        error = ctypes.get_last_error()
+        if error == ERROR_FILE_NOT_FOUND:
+            return
+        raise ctypes.WinError(error)
+    try:
+        while True:
+            name = data.cFileName
+            if name != "." and name != "..":
+                yield name, data.dwFileAttributes
+            if not _FindNextFileW(handle, ctypes.byref(data)):
+                break
+    finally:
+        _FindClose(handle)
+
+def _list_dir(path: str):
+    """Yield (name, is_dir, is_link) for each entry of a directory without following symlinks"""
+    if IS_WINDOWS:
+        # Junctions and symlinked folders are reparse points
+        for name, attributes in _win_scandir(path):
+            yield (name, bool(attributes & FILE_ATTRIBUTE_DIRECTORY),
+                   bool(attributes & FILE_ATTRIBUTE_REPARSE_POINT))
+        return
+    with os.scandir(path) as entries:
+        for entry in entries:
+            try:
+                yield entry.name, entry.is_dir(follow_symlinks=False), False
+            except OSError:
+                continue
+
+def _scan_tree(root: str, match_fn, max_depth: int = SCAN_MAX_DEPTH,
+               stop: Optional[threading.Event] = None,
+               skip_paths: frozenset = frozenset(),
+               skip_names: frozenset = SCAN_SKIP_DIRS) -> Iterator[Dict]:
+    """Breadth-first scan of a directory tree, yielding entries whose lowercased name matches"""
+    # (st_dev, st_ino) of queued directories, so bind mounts cannot make the scan loop
+    visited: Set[Tuple[int, int]] = set()
+    pending = deque([(root, 0)])
+    while pending:
+        # Another scan may already have found what we are looking for
+        if stop is not None and stop.is_set():
+            break
+        path, depth = pending.popleft()
+        try:
+            for name, is_dir, is_link in _list_dir(path):
+                name_lower = name.lower()
+                entry_path = os.path.join(path, name)
+                # Reparse points lead back into trees scanned elsewhere, and trees in
+                # skip_paths are scanned as roots of their own or not worth scanning
+                descend = (is_dir and not is_link and depth < max_depth and name_lower not in skip_names and
+                           not (skip_paths and os.path.normcase(entry_path) in skip_paths))
+                if descend and not IS_WINDOWS:
+                    try:
+                        dir_stat = os.lstat(entry_path)
+                        dir_id = (dir_stat.st_dev, dir_stat.st_ino)
+                        descend = dir_id not in visited
+                        visited.add(dir_id)
+                    except OSError:
+                        descend = False
+                if match_fn(name_lower):
+                    location = {
+                        "path": entry_path,
+                        "type": "directory" if is_dir else "file",
+                        "name": name,
+                        # Lowercased once here so callers don't repeat it
+                        "name_lower": name_lower
+                    }
+                    if is_dir:
+                        # Whether this directory's own entries are part of the scan
+                        location["scanned"] = descend
+                    yield location
+                if descend:
+                    pending.append((entry_path, depth + 1))
+        except OSError:
+            # Unreadable directories are skipped, as os.walk does
+            continue
+
+# Fixed parts of the task planning prompt
+PLAN_PROMPT_HEADER = """
+# TASK PLANNING AND ANALYSIS AGENT
+
+## CONTEXT INFORMATION
+- User Task: """
+
+PLAN_PROMPT_FOOTER = """
+
+## INSTRUCTIONS
+Analyze the user's task and create a structured execution plan:
+
+1. Break down the task into logical subtasks
+2. For each subtask, explain:
+   - What commands/approach you'll use
+   - Why this approach is optimal
+   - Any potential issues to watch for
+   - Required system resources or dependencies
+
+Return a JSON object with this structure:
+{
+  "task_summary": "Brief summary of what you understand the task to be",
+  "subtasks": [
+    {
+      "description": "Subtask description",
+      "approach": "How you will accomplish this subtask",
+      "commands": ["command1", "command2"],
+      "rationale": "Why this approach is best",
+      "potential_issues": "What might go wrong",
+      "required_resources": ["resource1", "resource2"],
+      "fallback_commands": ["fallback1", "fallback2"]
+    }
+  ],
+  "estimated_steps": 5,
+  "system_requirements": {
+    "disk_space": "required space",
+    "memory": "required memory",
+    "dependencies": ["dep1", "dep2"]
+  }
+}
+"""
+
+def needs_generated_commands(subtask: Dict) -> bool:
+    """Check whether a subtask will ask the model for commands rather than use its own or a built-in handler"""
+    if subtask.get('commands'):
+        return False
+    # File sorting is handled without the model; install subtasks only skip it when
+    # the package turns out to be installed already, which is known only when they run
+    description = subtask.get('description', '').lower()
+    return not ("sort" in description and "file" in description)
+
+# PowerShell snapshots of system load, limited to a fixed number of samples
+PS_COUNTERS_COMMAND = "powershell -Command \"Get-Counter '\\Processor(_Total)\\% Processor Time', '\\Memory\\% Committed Bytes In Use' -SampleInterval 1 -MaxSamples 10 | Format-Table -AutoSize\""
+PS_TOP_PROCESSES_COMMAND = "powershell -Command \"Get-Process | Sort-Object -Property CPU -Descending | Select-Object -First 10 Name, CPU, WorkingSet, ID | Format-Table -AutoSize\""
+
+# Snapshot commands used for real-time monitoring tasks, limited to a fixed number of samples
+if IS_WINDOWS:
+    LIVE_MONITORING_COMMANDS = (PS_COUNTERS_COMMAND, PS_TOP_PROCESSES_COMMAND)
+else:
+    LIVE_MONITORING_COMMANDS = ("top -n 10 -b", "free -m", "ps aux --sort=-%cpu | head -n 11")
+
+# Safe default commands by task keyword: (keywords, Windows commands, POSIX commands).
+# The first entry with a keyword in the task wins.
+KEYWORD_DEFAULT_COMMANDS = [
+    (("file", "list"), ["dir"], ["ls -la"]),
+    (("process",), ["tasklist"], ["ps aux"]),
+    (("network",), ["ipconfig /all"], ["ifconfig"]),
+    (("system", "info"), ["systeminfo"], ["uname -a && cat /etc/os-release"]),
+    (("cpu", "memory", "monitor"), [PS_TOP_PROCESSES_COMMAND, PS_COUNTERS_COMMAND], ["top -n 10 -b", "free -m"])
+]
+FALLBACK_DEFAULT_COMMANDS = (["dir"], ["ls"])
+
+# The same tables narrowed to this platform's commands once at import
+PLATFORM_DEFAULT_COMMANDS = [
+    (keywords, windows_commands if IS_WINDOWS else posix_commands)
+    for keywords, windows_commands, posix_commands in KEYWORD_DEFAULT_COMMANDS
+]
+PLATFORM_FALLBACK_COMMANDS = FALLBACK_DEFAULT_COMMANDS[0 if IS_WINDOWS else 1]
+
+def get_default_commands(text_lower: str) -> List[str]:
+    """Get the safe default commands for a lowercased task description"""
+    for keywords, commands in PLATFORM_DEFAULT_COMMANDS:
+        if any(keyword in text_lower for keyword in keywords):
+            return list(commands)
+    return list(PLATFORM_FALLBACK_COMMANDS)
+
+# Prompt templates, filled in with str.format on each call
+VERIFY_PROMPT_TEMPLATE = """
+# COMMAND EXECUTION VERIFICATION
+
+## COMMAND CONTEXT
+Command: {command}
+Exit Code: {exit_code}
+Output:
+{stdout}
+Errors:
+{stderr}
+
+## PLAN CONTEXT
+Main Task: {task}
+Current Subtask: {subtask}
+Next Subtask: {next_subtask}
+
+## INSTRUCTIONS
+Analyze the command execution result and determine:
+1. Was the command successful?
+2. What is the current state of the system?
+3. What should be the next action?
+4. If the current subtask fails, should the plan go on to the next subtask?
+
+Return a JSON object with this structure:
+{{
+    "success": true/false,
+    "system_state": "description of current state",
+    "next_action": {{
+        "action": "continue/retry/skip/abort",
+        "reason": "why this action was chosen",
+        "fallback_command": "alternative command if retrying",
+        "continue_plan": true/false,
+        "continue_reason": "why the plan should or shouldn't go on if this subtask fails"
+    }},
+    "diagnostics": {{
+        "is_installed": true/false,
+        "error_type": "none/not_found/permission/network/etc",
+        "suggested_fix": "what needs to be done"
+    }}
+}}
+"""
+
+CMDGEN_PROMPT_TEMPLATE = """
+# TERMINAL COMMAND GENERATOR
+
+## CONTEXT
+- Task: {task_context}
+- Current Directory: {current_directory}
+- OS: {platform}
+- Recent Commands:
+{recent_commands}
+- Recent Errors:
+{recent_errors}
+
+## INSTRUCTIONS
+Generate the most efficient terminal commands to accomplish this task.
+Return ONLY raw, executable commands with NO explanations or formatting.
+Ensure commands are appropriate for the user's operating system.
+
+### WINDOWS GUIDELINES
+- Use PowerShell for complex tasks
+- Use CMD for simple tasks
+- Avoid continuous monitoring commands that run indefinitely
+- For PowerShell commands that typically would use -Continuous flag, use -MaxSamples 10 instead
+- For complex PowerShell commands, use: powershell -Command "Your-Command-Here"
+
+### RETURN FORMAT
+Return ONLY the raw commands, one per line, with NO explanations, backticks, or markdown.
+"""
+
+QUESTION_PROMPT_TEMPLATE = """
+# CLARIFICATION QUESTION GENERATION
+
+Given the following task context, determine if there's any critical information missing 
+to complete the task effectively. If there is, generate a single direct question to ask the user.
+If no question is needed, respond with "NO_QUESTION_NEEDED".
+
+## CONTEXT
+{context}
+
+## INSTRUCTIONS
+- Only ask if truly necessary for task completion
+- Ask about critical parameters, preferences, or constraints
+- Keep questions short and direct
+- If the task is clear and has sufficient information, return "NO_QUESTION_NEEDED"
+
+## OUTPUT FORMAT
+Return ONLY the question text or "NO_QUESTION_NEEDED", nothing else.
+"""
+
+CONTINUATION_PROMPT_TEMPLATE = """
+# SUBTASK CONTINUATION DECISION
+
+Current subtask failed but there are more subtasks available.
+Should we continue to the next subtask?
+
+Context:
+- Failed Subtask: {failed_subtask}
+- Next Subtask: {next_subtask}
+- System State: {system_state}
+
+Return a JSON object with this structure:
+{{
+    "should_continue": true/false,
+    "reason": "why we should or shouldn't continue"
+}}
+"""
+
+# Static instructions for conversational replies
+CONVERSATIONAL_SYSTEM_PROMPT = """
+# CONVERSATIONAL RESPONSE
+
+You are an AI terminal assistant that helps users with computer tasks.
+The user has sent a conversational message rather than a task request.
+Respond naturally and conversationally to the user's input.
+
+Remember:
+- Keep your response friendly and concise
+- Ask if they'd like help with a specific terminal task if appropriate
+- Don't provide any commands unless specifically requested
+"""
+
+# Per-turn prompt pieces, concatenated around the user's message
+CONV_PROMPT_PREFIX = CONVERSATIONAL_SYSTEM_PROMPT + "\nUser message: "
+CONV_PROMPT_SUFFIX = "\n"
+
 class TaskState:
     """Represents the state of a task in the agent system"""
+    # Colors used when rendering each task status
+    _STATUS_COLORS = {
+        "pending": Fore.YELLOW,
+        "in_progress": Fore.CYAN,
+        "completed": Fore.GREEN,
+        "failed": Fore.RED
+    }
+    
     def __init__(self, task_id: str, description: str, status: str = "pending"):
         self.task_id = task_id
         self.description = description
         self.status = status  # pending, in_progress, completed, failed
-        self.start_time = None
-        self.end_time = None
+        # time.monotonic() readings, so durations are unaffected by clock changes
+        self.start_time: Optional[float] = None
+        self.end_time: Optional[float] = None
         self.subtasks: List["TaskState"] = []
+        self._next_subtask_id = 1
         self.parent_task: Optional["TaskState"] = None
         self.command_history: List[Dict] = []
         self.output: str = ""
@@ -100,23 +1023,25 @@ class TaskState:
     def start(self):
         """Mark task as started"""
         self.status = "in_progress"
-        self.start_time = datetime.now()
+        self.start_time = time.monotonic()
         
     def complete(self, output: str = ""):
         """Mark task as completed"""
         self.status = "completed"
-        self.end_time = datetime.now()
+        self.end_time = time.monotonic()
         self.output = output
         
     def fail(self, error: str = ""):
         """Mark task as failed"""
         self.status = "failed"
-        self.end_time = datetime.now()
+        self.end_time = time.monotonic()
         self.error = error
         
     def add_subtask(self, description: str) -> "TaskState":
         """Add a subtask to this task"""
-        subtask_id = f"{self.task_id}.{len(self.subtasks) + 1}"
+        sid = self._next_subtask_id
+        self._next_subtask_id += 1
+        subtask_id = f"{self.task_id}.{sid}"
         subtask = TaskState(subtask_id, description)
         subtask.parent_task = self
         self.subtasks.append(subtask)
@@ -129,8 +1054,8 @@ class TaskState:
     @property
     def duration(self) -> Optional[float]:
         """Get task duration in seconds"""
-        if self.start_time and self.end_time:
-            return (self.end_time - self.start_time).total_seconds()
+        if self.start_time is not None and self.end_time is not None:
+            return self.end_time - self.start_time
         return None
         
     @property
@@ -150,60 +1075,91 @@ class TaskState:
         
     def __str__(self) -> str:
         """String representation of task"""
-        status_color = {
-            "pending": Fore.YELLOW,
-            "in_progress": Fore.CYAN,
-            "completed": Fore.GREEN,
-            "failed": Fore.RED
-        }.get(self.status, Fore.WHITE)
+        status_color = TaskState._STATUS_COLORS.get(self.status, Fore.WHITE)
         
         return f"[{status_color}{self.status.upper()}{Style.RESET_ALL}] {self.task_id}: {self.description}"
 
 class AgentContext:
     """Maintains context and conversation history for the agent"""
-    def __init__(self):
-        self.conversation_history: List[Dict] = []
+    # Message roles, stored as small integers in conv_roles
+    ROLES = ("user", "agent", "system")
+    ROLE_USER, ROLE_AGENT, ROLE_SYSTEM = range(3)
+    
+    MAX_RECENT_ERRORS = 50
+    
+    def __init__(self, max_history: int = 100):
+        self.max_history = max(1, max_history)
+        # Conversation history is kept as parallel columns rather than one dict per message
+        self.conv_roles = array('B')
+        self.conv_contents: List[str] = []
+        self.conv_timestamps = array('q')  # time.time_ns()
         self.current_task: Optional[TaskState] = None
-        self.task_history: List[TaskState] = []
+        # Only the newest tasks, commands and errors are kept; totals are counted separately
+        self.task_history: Deque[TaskState] = deque(maxlen=self.max_history)
+        self.task_by_id: Dict[str, TaskState] = {}
+        self._next_task_id = 1
         self.current_directory = os.getcwd()
         self.variables: Dict[str, Any] = {}
-        self.session_start_time = datetime.now()
-        self.file_access_history: Dict[str, datetime] = {}
-        self.command_history: List[Dict] = []
-        self.recent_errors: List[Tuple[str, str]] = []  # (command, error_msg)
+        self.session_start_time = time.monotonic()
+        self.file_access_history: Dict[str, int] = {}  # path -> time.time_ns()
+        self.command_history: Deque[Dict] = deque(maxlen=self.max_history)
+        self.command_count = 0
+        self.recent_errors: Deque[Tuple[str, str]] = deque(maxlen=AgentContext.MAX_RECENT_ERRORS)  # (command, error_msg)
+        self.error_count = 0
+        # Tails of the histories above, already formatted for prompts
+        self.recent_commands: Deque[str] = deque(maxlen=5)
+        self.recent_command_lines: Deque[str] = deque(maxlen=5)
+        self.recent_error_lines: Deque[str] = deque(maxlen=3)
+    
+    @property
+    def conversation_history(self) -> List[Dict]:
+        """Conversation history as a list of message dicts, built on demand"""
+        return [
+            {"role": AgentContext.ROLES[role], "content": content, "timestamp": timestamp}
+            for role, content, timestamp in zip(self.conv_roles, self.conv_contents, self.conv_timestamps)
+        ]
+    
+    def add_message(self, role: int, message: str):
+        """Add a message with the given role to conversation history"""
+        self.conv_roles.append(role)
+        self.conv_contents.append(message)
+        self.conv_timestamps.append(time.time_ns())
+        # Trim in batches so the columns are not shifted on every message
+        excess = len(self.conv_contents) - 2 * self.max_history
+        if excess > 0:
+            drop = excess + self.max_history
+            del self.conv_roles[:drop]
+            del self.conv_contents[:drop]
+            del self.conv_timestamps[:drop]
         
     def add_user_message(self, message: str):
         """Add user message to conversation history"""
-        self.conversation_history.append({
-            "role": "user",
-            "content": message,
-            "timestamp": datetime.now().isoformat()
-        })
+        self.add_message(AgentContext.ROLE_USER, message)
         
     def add_agent_message(self, message: str):
         """Add agent message to conversation history"""
-        self.conversation_history.append({
-            "role": "agent",
-            "content": message,
-            "timestamp": datetime.now().isoformat()
-        })
+        self.add_message(AgentContext.ROLE_AGENT, message)
         
     def add_system_message(self, message: str):
         """Add system message to conversation history"""
-        self.conversation_history.append({
-            "role": "system",
-            "content": message,
-            "timestamp": datetime.now().isoformat()
-        })
+        self.add_message(AgentContext.ROLE_SYSTEM, message)
         
     def start_task(self, description: str) -> TaskState:
         """Start a new main task"""
-        task_id = str(len(self.task_history) + 1)
+        task_id = str(self._next_task_id)
+        self._next_task_id += 1
         task = TaskState(task_id, description)
         task.start()
         self.current_task = task
+        if len(self.task_history) == self.task_history.maxlen:
+            self.task_by_id.pop(self.task_history[0].task_id, None)
         self.task_history.append(task)
+        self.task_by_id[task_id] = task
         return task
+    
+    def get_task(self, task_id: str) -> Optional[TaskState]:
+        """Look up a recent main task by its ID"""
+        return self.task_by_id.get(task_id)
         
     def start_subtask(self, description: str) -> Optional[TaskState]:
         """Start a subtask under the current task"""
@@ -235,23 +1191,42 @@ class AgentContext:
         if self.current_task:
             self.current_task.add_command(command_data)
         self.command_history.append(command_data)
+        self.command_count += 1
+        command = command_data.get('command', '')
+        self.recent_commands.append(command)
+        self.recent_command_lines.append(f"- {command}")
+        
+    def add_recent_error(self, command: str, error_msg: str):
+        """Record a failed command and its error output"""
+        self.recent_errors.append((command, error_msg))
+        self.error_count += 1
+        self.recent_error_lines.append(f"- Command: {command}, Error: {error_msg}")
         
     def record_file_access(self, file_path: str):
         """Record file access in history"""
-        self.file_access_history[file_path] = datetime.now()
+        self.file_access_history[file_path] = time.time_ns()
         
     def get_context_summary(self) -> str:
         """Get a summary of the current context for the agent"""
         return f"""
 Current Directory: {self.current_directory}
 Current Task: {self.current_task.description if self.current_task else 'None'}
-Total Tasks: {len(self.task_history)}
-Command History: {len(self.command_history)} commands
+Total Tasks: {self._next_task_id - 1}
+Command History: {self.command_count} commands
 Recent Files: {', '.join(list(self.file_access_history.keys())[-5:]) if self.file_access_history else 'None'}
-Recent Errors: {len(self.recent_errors)}
-Session Duration: {str(datetime.now() - self.session_start_time).split('.')[0]}
+Recent Errors: {self.error_count}
+Session Duration: {str(timedelta(seconds=int(time.monotonic() - self.session_start_time)))}
 """
 
+@functools.lru_cache(maxsize=1)
+def _parse_config_file(path: str, mtime: float) -> Dict:
+    """Parse a YAML config file; the mtime argument makes the cache miss once the file changes"""
+    # Imported here since the config is rarely read more than once
+    import yaml
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    with open(path) as f:
+        return yaml.load(f, Loader=loader) or {}
+
 class AgentTerminal:
     """Terminal-based AI assistant agent"""
     
@@ -260,17 +1235,30 @@ class AgentTerminal:
         # Initialize Gemini in silent mode if requested
         init_gemini(silent=silent_init)
         
-        self.context = AgentContext()
         self.config = self.load_config()
+        self.context = AgentContext(self.config.get("max_history", 100))
         self.command_history = []
+        self._history_saved = 0
+        self._history_lines = 0  # Entries in the history file, including ones no longer in memory
         self.auto_run = self.config.get("auto_run", False)
         self.silent_init = silent_init
         
         if auto_run:
             self.auto_run = True
         
+        # Chance of asking a clarifying question, as a threshold for 16 random bits
+        self._question_threshold = int(self.config.get("question_probability", 0.1) * 65536)
+        
+        # Seconds to wait before an auto-run plan starts; AGENT_NO_CONFIRM=1 skips the wait
+        if os.environ.get("AGENT_NO_CONFIRM") == "1":
+            self.auto_run_delay = 0.0
+        else:
+            self.auto_run_delay = float(self.config.get("auto_run_delay", 3))
+        
         # Load command history from previous sessions
         self.load_history()
+        # Relative cache file names are kept in the per-user data folder, not the working directory
+        PROMPT_CACHE.load(os.path.join(USER_DATA_DIR, self.config.get("prompt_cache_file", "prompt_cache.json")))
         
         if not silent_init:
             print("Agent Terminal Assistant initialized")
@@ -285,185 +1273,125 @@ class AgentTerminal:
     
     def is_conversational_query(self, text: str) -> bool:
         """Check if the user input is conversational rather than a task"""
-        # Common conversational patterns
-        conversational_patterns = [
-            r'^hi\b', 
-            r'^hello\b', 
-            r'^hey\b',
-            r'how are you',
-            r'^what\'?s up',
-            r'^good morning',
-            r'^good afternoon',
-            r'^good evening',
-            r'^\?',
-            r'^who are you',
-            r'^tell me about yourself',
-            r'^what can you do'
-        ]
-        
-        # Check if any pattern matches
-        text_lower = text.lower()
-        if any(re.search(pattern, text_lower) for pattern in conversational_patterns):
-            return True
-            
-        # List of task-related terms that should be processed as commands, not conversations
-        task_terms = ['install', 'create', 'delete', 'find', 'run', 'show', 'list', 'make', 'exec', 
-                      'search', 'organize', 'copy', 'move', 'check', 'get', 'display', 'monitor', 
-                      'analyze', 'download', 'upload', 'convert', 'rename', 'backup']
-        
-        # Technical/system-specific terms that strongly indicate a command, not conversation
-        technical_terms = ['cpu', 'memory', 'ram', 'disk', 'drive', 'file', 'folder', 'directory', 
-                           'process', 'system', 'network', 'port', 'usage', 'real-time', 'realtime',
-                           'performance', 'monitor', 'resource', 'task manager', 'log', 'service',
-                           'registry', 'database', 'hardware', 'software', 'driver', 'update']
-        
-        # If it contains technical terms, definitely treat as a command
-        if any(term in text_lower for term in technical_terms):
-            return False
-            
-        # If it contains task-related terms, it's not conversational
-        if any(term in text_lower for term in task_terms):
-            return False
-            
-        # Special case: monitoring commands should never be conversational
-        monitoring_patterns = [
-            r'(show|display|check|monitor|get).*(cpu|processor|memory|ram|system).*(usage|performance|status|health)',
-            r'(cpu|memory|ram|system).*(usage|monitor|status|performance)',
-            r'(show|display|monitor).*(resource|usage|performance)',
-            r'real.?time.*(monitor|usage|performance|stats)',
-            r'how.*(much|many).*(cpu|memory|ram)'
-        ]
-        
-        if any(re.search(pattern, text_lower) for pattern in monitoring_patterns):
-            return False
-            
-        # If it's very short (1-3 words) and doesn't contain task-related terms
-        word_count = len(text_lower.split())
-        if word_count <= 3:
-            return True
-            
-        return False
+        return classify_input(text).is_conversational
         
     def handle_conversation(self, user_input: str):
         """Handle conversational queries directly using the AI model"""
         print(f"{Fore.CYAN}Processing your message...{Style.RESET_ALL}")
         
-        prompt = f"""
-# CONVERSATIONAL RESPONSE
-
-You are an AI terminal assistant that helps users with computer tasks.
-The user has sent a conversational message rather than a task request.
-Respond naturally and conversationally to the user's input.
-
-User message: {user_input}
-
-Remember:
-- Keep your response friendly and concise
-- Ask if they'd like help with a specific terminal task if appropriate
-- Don't provide any commands unless specifically requested
-"""
         try:
-            response = MODEL.generate_content(prompt)
-            text = response.text.strip()
-            print(f"\n{text}\n")
+            self.context.add_user_message(user_input)
+            prompt = CONV_PROMPT_PREFIX + user_input + CONV_PROMPT_SUFFIX
+            text = self.stream_response(MODEL, prompt)
+            self.context.add_agent_message(text)
             return True
         except Exception as e:
             print(f"{Fore.RED}Error generating conversational response: {str(e)}{Style.RESET_ALL}")
             print("Hello! How can I help you with your terminal tasks today?")
             return True
+    
+    def stream_response(self, model, prompt: str) -> str:
+        """Print a model response as it is generated and return the full text"""
+        parts = []
+        print()
+        for chunk in model.generate_content(prompt, stream=True):
+            text = chunk.text
+            if not parts:
+                # Match the old stripped output for the first chunk
+                text = text.lstrip()
+                if not text:
+                    continue
+            sys.stdout.write(text)
+            sys.stdout.flush()
+            parts.append(text)
+        print("\n")
+        return "".join(parts).strip()
+    
+    def _input_exit(self) -> bool:
+        """Save history and stop the input loop"""
+        self.save_history()
+        return False
+    
+    def _input_help(self) -> bool:
+        self.show_help()
+        return True
+    
+    def _input_history(self) -> bool:
+        self.display_command_history()
+        return True
+    
+    def _input_tasks(self) -> bool:
+        self.display_task_status()
+        return True
+    
+    def _input_context(self) -> bool:
+        self.display_context()
+        return True
+    
+    def _input_auto_on(self) -> bool:
+        self.auto_run = True
+        print("Auto-run mode enabled")
+        return True
+    
+    def _input_auto_off(self) -> bool:
+        self.auto_run = False
+        print("Auto-run mode disabled")
+        return True
+    
+    def _input_clear(self) -> bool:
+        os.system('cls' if IS_WINDOWS else 'clear')
+        return True
+    
+    def _input_pwd(self) -> bool:
+        print(os.getcwd())
+        return True
+    
+    # Lowercased input -> handler returning whether to keep reading input
+    INPUT_COMMANDS = {
+        "exit": _input_exit,
+        "help": _input_help,
+        "history": _input_history,
+        "tasks": _input_tasks,
+        "context": _input_context,
+        "auto on": _input_auto_on,
+        "auto off": _input_auto_off,
+        "clear": _input_clear,
+        "pwd": _input_pwd,
+    }
             
     def process_user_input(self, user_input):
         """Process a single user input and execute it"""
         user_input = user_input.strip()
+        
+        # Built-in commands are matched with one lookup on the lowercased input
+        input_lower = user_input.lower()
+        handler = AgentTerminal.INPUT_COMMANDS.get(input_lower)
+        if handler is not None:
+            return handler(self)
             
-        if user_input.lower() == 'exit':
-            self.save_history()
-            return False
-            
-        if user_input.lower() == 'help':
-            self.show_help()
-            return True
-            
-        if user_input.lower() == 'history':
-            self.display_command_history()
-            return True
-            
-        if user_input.lower() == 'tasks':
-            self.display_task_status()
-            return True
-            
-        if user_input.lower() == 'context':
-            self.display_context()
-            return True
-            
-        if user_input.lower() == 'auto on':
-            self.auto_run = True
-            print("Auto-run mode enabled")
-            return True
-            
-        if user_input.lower() == 'auto off':
-            self.auto_run = False
-            print("Auto-run mode disabled")
-            return True
-            
-        if user_input.lower() == 'clear':
-            os.system('cls' if platform.system() == 'Windows' else 'clear')
-            return True
-            
-        if user_input.lower().startswith('cd '):
+        if input_lower.startswith('cd '):
             path = user_input[3:].strip()
             self.change_directory(path)
             return True
             
-        if user_input.lower() == 'pwd':
-            print(os.getcwd())
-            return True
-            
-        # Enhanced check for monitoring commands before other processing
-        # This should happen before the conversational query check
-        user_input_lower = user_input.lower()
-        is_monitoring = False
-        
-        # Comprehensive check for various monitoring command formats
-        if (('show' in user_input_lower or 'display' in user_input_lower or 'monitor' in user_input_lower) and 
-            ('cpu' in user_input_lower or 'processor' in user_input_lower or 'memory' in user_input_lower or 
-             'ram' in user_input_lower or 'resource' in user_input_lower or 'system' in user_input_lower) and
-            ('usage' in user_input_lower or 'performance' in user_input_lower or 'status' in user_input_lower or 
-             'real-time' in user_input_lower or 'realtime' in user_input_lower)):
-            is_monitoring = True
-            
-        # Additional checks for more specific monitoring patterns
-        monitoring_patterns = [
-            r'(show|display|check|monitor|get).*(cpu|processor|memory|ram|system).*(usage|performance|status|health)',
-            r'(cpu|memory|ram|system).*(usage|monitor|status|performance)',
-            r'(show|display|monitor).*(resource|usage|performance)',
-            r'real.?time.*(monitor|usage|performance|stats)',
-            r'how.*(much|many).*(cpu|memory|ram)'
-        ]
-        
-        if not is_monitoring:
-            is_monitoring = any(re.search(pattern, user_input_lower) for pattern in monitoring_patterns)
-            
-        # Handle monitoring commands with direct execution
-        if is_monitoring:
-            print(f"{Fore.CYAN}Detected system monitoring command. Processing...{Style.RESET_ALL}")
-            self.handle_monitoring_command(user_input)
-            
-            # Add to command history
-            self.command_history.append(user_input)
-            if not self.silent_init:
-                self.save_history()
-                
-            return True
+        # Classify the input once; monitoring commands are checked before the
+        # conversational query check
+        classified = classify_input(user_input)
             
         # Check if this is a conversational query rather than a task
-        if self.is_conversational_query(user_input):
+        if classified.is_conversational and not classified.is_monitoring:
             return self.handle_conversation(user_input)
             
-        # Add to command history
+        # Add to command history (monitoring commands and tasks alike)
         self.command_history.append(user_input)
         if not self.silent_init:
             self.save_history()
+            
+        # Handle monitoring commands with direct execution
+        if classified.is_monitoring:
+            print(f"{Fore.CYAN}Detected system monitoring command. Processing...{Style.RESET_ALL}")
+            self.handle_monitoring_command(user_input)
+            return True
         
         # Process the task
         self.process_user_task(user_input)
@@ -471,14 +1399,8 @@ Remember:
     
     def is_monitoring_command(self, command: str) -> bool:
         """Check if a command is requesting real-time monitoring"""
-        command_lower = command.lower()
-        monitoring_terms = ["real-time", "realtime", "monitor", "live", "continuous"]
-        resource_terms = ["cpu", "memory", "ram", "processor", "system", "resources", "performance"]
-        
-        has_monitoring = any(term in command_lower for term in monitoring_terms)
-        has_resource = any(term in command_lower for term in resource_terms)
-        
-        return has_monitoring and has_resource
+        flags = classify_input(command).flags
+        return bool(flags & TERM_MONITOR) and bool(flags & TERM_RESOURCE)
     
     def handle_monitoring_command(self, command: str) -> None:
         """Handle real-time monitoring commands directly"""
@@ -493,57 +1415,43 @@ Remember:
         show_memory = True
         
         # Check what resources to monitor based on command
-        command_lower = command.lower()
+        classified = classify_input(command)
+        command_lower = classified.text_lower
+        is_live = classified.is_live
         if 'cpu' in command_lower and 'memory' not in command_lower and 'ram' not in command_lower:
             show_memory = False
         elif ('memory' in command_lower or 'ram' in command_lower) and 'cpu' not in command_lower:
             show_cpu = False
         
-        # Different commands based on platform
-        if platform.system() == "Windows":
-            monitoring_results = []
-            
-            # Create a better command for monitoring that doesn't use continuous mode
-            if show_cpu:
-                # Display top CPU-consuming processes
-                print(f"{Fore.YELLOW}Top CPU consumers:{Style.RESET_ALL}")
-                monitor_cmd = "powershell -Command \"Get-Process | Sort-Object -Property CPU -Descending | Select-Object -First 10 Name, CPU, WorkingSet, ID | Format-Table -AutoSize\""
-                result = self.execute_command(monitor_cmd)
-                if result["exit_code"] == 0:
-                    monitoring_results.append("CPU process list: Success")
-                else:
-                    monitoring_results.append("CPU process list: Failed")
-                    
-                # Show current CPU usage percentage
-                print(f"{Fore.YELLOW}Current CPU usage:{Style.RESET_ALL}")
-                cpu_cmd = "powershell -Command \"$CPU = (Get-Counter '\\Processor(_Total)\\% Processor Time' -SampleInterval 1 -MaxSamples 1).CounterSamples.CookedValue; Write-Host ('CPU usage: {0:N2}%' -f $CPU)\""
-                result = self.execute_command(cpu_cmd)
-                if result["exit_code"] == 0:
-                    monitoring_results.append("CPU usage percentage: Success")
-                else:
-                    monitoring_results.append("CPU usage percentage: Failed")
-            
-            if show_memory:
-                # Show memory usage
-                print(f"{Fore.YELLOW}Memory usage:{Style.RESET_ALL}")
-                memory_cmd = "powershell -Command \"Get-CimInstance Win32_OperatingSystem | Select-Object @{Name='TotalVisibleMemory (MB)';Expression={[math]::Round($_.TotalVisibleMemorySize/1KB,2)}}, @{Name='FreePhysicalMemory (MB)';Expression={[math]::Round($_.FreePhysicalMemory/1KB,2)}}, @{Name='UsedMemory (MB)';Expression={[math]::Round(($_.TotalVisibleMemorySize-$_.FreePhysicalMemory)/1KB,2)}}, @{Name='MemoryUsage (%)';Expression={[math]::Round(($_.TotalVisibleMemorySize-$_.FreePhysicalMemory)/$_.TotalVisibleMemorySize*100,2)}} | Format-Table -AutoSize\""
-                result = self.execute_command(memory_cmd)
-                if result["exit_code"] == 0:
-                    monitoring_results.append("Memory usage information: Success")
-                else:
-                    monitoring_results.append("Memory usage information: Failed")
-                
-                # Show memory usage by process
-                print(f"{Fore.YELLOW}Top memory consumers:{Style.RESET_ALL}")
-                mem_process_cmd = "powershell -Command \"Get-Process | Sort-Object -Property WorkingSet -Descending | Select-Object -First 10 Name, @{Name='Memory (MB)';Expression={[math]::Round($_.WorkingSet/1MB,2)}}, CPU, ID | Format-Table -AutoSize\""
-                result = self.execute_command(mem_process_cmd)
-                if result["exit_code"] == 0:
-                    monitoring_results.append("Memory process list: Success")
-                else:
-                    monitoring_results.append("Memory process list: Failed")
-            
-            # Real-time monitoring hint
-            if "real-time" in command_lower or "realtime" in command_lower or "continuous" in command_lower or "live" in command_lower:
+        # Collect statistics in-process with psutil instead of spawning shell tools
+        steps = []
+        if show_cpu:
+            steps.append(("CPU process list", lambda: self.show_top_processes(processes, "cpu")))
+            steps.append(("CPU usage percentage", lambda: self.show_cpu_usage(cpu_percent)))
+        if show_memory:
+            steps.append(("Memory usage information", self.show_memory_usage))
+            steps.append(("Memory process list", lambda: self.show_top_processes(processes, "memory")))
+        
+        monitoring_results = []
+        try:
+            # One process snapshot; all CPU counters share a single sampling window
+            processes, cpu_percent = self.sample_processes(measure_cpu=show_cpu)
+        except Exception as e:
+            print(f"{Fore.RED}Error sampling system usage: {str(e)}{Style.RESET_ALL}")
+            monitoring_results = [f"{label}: Failed" for label, _ in steps]
+            steps = []
+        
+        for label, step in steps:
+            try:
+                step()
+                monitoring_results.append(f"{label}: Success")
+            except Exception as e:
+                print(f"{Fore.RED}Error collecting {label.lower()}: {str(e)}{Style.RESET_ALL}")
+                monitoring_results.append(f"{label}: Failed")
+        
+        # Different real-time monitoring tools based on platform
+        if IS_WINDOWS:
+            if is_live:
                 print(f"\n{Fore.GREEN}For continuous real-time monitoring, using Task Manager is recommended.{Style.RESET_ALL}")
                 print(f"{Fore.CYAN}Would you like to open Task Manager now? (y/n){Style.RESET_ALL}")
                 response = input("> ").strip().lower()
@@ -555,58 +1463,134 @@ Remember:
                 # Provide info about real-time monitoring
                 print(f"\n{Fore.GREEN}System monitoring snapshot complete.{Style.RESET_ALL}")
                 print(f"{Fore.CYAN}For continuous real-time monitoring, you can use Task Manager.{Style.RESET_ALL}")
-            
-            # Complete the task
-            self.context.complete_current_task("\n".join(monitoring_results))
-            
         else:
-            # Linux monitoring
-            monitoring_results = []
-            
-            if show_cpu:
-                print(f"{Fore.YELLOW}Top CPU consumers:{Style.RESET_ALL}")
-                result = self.execute_command("ps aux --sort=-%cpu | head -n 11")
-                if result["exit_code"] == 0:
-                    monitoring_results.append("CPU process list: Success")
-                else:
-                    monitoring_results.append("CPU process list: Failed")
-                
-                print(f"{Fore.YELLOW}System load:{Style.RESET_ALL}")
-                result = self.execute_command("uptime")
-                if result["exit_code"] == 0:
-                    monitoring_results.append("System load: Success")
-                else:
-                    monitoring_results.append("System load: Failed")
-            
-            if show_memory:
-                print(f"{Fore.YELLOW}Memory usage:{Style.RESET_ALL}")
-                result = self.execute_command("free -h")
-                if result["exit_code"] == 0:
-                    monitoring_results.append("Memory usage: Success")
-                else:
-                    monitoring_results.append("Memory usage: Failed")
-            
-            # Real-time monitoring hint
-            if "real-time" in command_lower or "realtime" in command_lower or "continuous" in command_lower or "live" in command_lower:
+            if is_live:
                 print(f"\n{Fore.GREEN}For continuous real-time monitoring, you can use the 'top' command in a separate terminal.{Style.RESET_ALL}")
                 print(f"{Fore.CYAN}Would you like to run 'top' now? (y/n){Style.RESET_ALL}")
                 response = input("> ").strip().lower()
                 if response == "y" or response == "yes":
                     print(f"{Fore.CYAN}Running top (press q to exit)...{Style.RESET_ALL}")
-                    result = self.execute_command("top")
-                    monitoring_results.append("Ran top command")
+                    exit_code = self.run_interactive(["top"])
+                    monitoring_results.append(f"Ran top command (exit code {exit_code})")
             else:
                 print(f"\n{Fore.GREEN}System monitoring complete. For continuous monitoring, use 'top' in a separate terminal.{Style.RESET_ALL}")
-            
-            # Complete the task
-            self.context.complete_current_task("\n".join(monitoring_results))
+        
+        # Complete the task
+        self.context.complete_current_task("\n".join(monitoring_results))
+    
+    def run_interactive(self, argv: List[str]) -> int:
+        """Run a program attached to this terminal and return its exit code"""
+        if hasattr(os, "posix_spawnp"):
+            # posix_spawn avoids copying this (large) process the way fork+exec does
+            pid = os.posix_spawnp(argv[0], argv, os.environ)
+            _, status = os.waitpid(pid, 0)
+            return os.waitstatus_to_exitcode(status) if hasattr(os, "waitstatus_to_exitcode") else status >> 8
+        return subprocess.call(argv, cwd=self.context.current_directory)
+    
+    def print_table(self, title: str, columns: List[str], rows: List[Tuple]):
+        """Print rows as a table, using rich formatting when available"""
+        rich = get_rich()
+        if rich:
+            table = rich["Table"](title=title, title_justify="left")
+            for column in columns:
+                table.add_column(column)
+            for row in rows:
+                table.add_row(*[str(value) for value in row])
+            rich["console"].print(table)
+            return
+        
+        print(f"{Fore.YELLOW}{title}:{Style.RESET_ALL}")
+        widths = [max(len(str(value)) for value in [column] + [row[i] for row in rows]) for i, column in enumerate(columns)]
+        print("  ".join(column.ljust(width) for column, width in zip(columns, widths)))
+        print("  ".join("-" * width for width in widths))
+        for row in rows:
+            print("  ".join(str(value).ljust(width) for value, width in zip(row, widths)))
+    
+    def sample_processes(self, measure_cpu: bool = True) -> Tuple[List[Tuple], Optional[float]]:
+        """Snapshot running processes as (name, pid, cpu %, memory MB) rows plus overall CPU usage"""
+        # Imported here since only the monitoring commands need it
+        import psutil
+        processes = list(psutil.process_iter(['pid', 'name', 'memory_info']))
+        
+        cpu_percent = None
+        if measure_cpu:
+            # CPU usage is measured between two calls, so prime the system-wide and
+            # per-process counters together and wait out one sampling window for all of them
+            psutil.cpu_percent(None)
+            for proc in processes:
+                try:
+                    proc.cpu_percent(None)
+                except psutil.Error:
+                    pass
+            time.sleep(MONITOR_SAMPLE_INTERVAL)
+            cpu_percent = psutil.cpu_percent(None)
+        
+        rows = []
+        for proc in processes:
+            try:
+                proc_cpu = proc.cpu_percent(None) if measure_cpu else 0.0
+            except psutil.Error:
+                continue
+            memory_info = proc.info['memory_info']
+            memory_mb = memory_info.rss / (1024 * 1024) if memory_info else 0.0
+            rows.append((proc.info['name'] or "?", proc.info['pid'], proc_cpu, memory_mb))
+        return rows, cpu_percent
+    
+    def show_top_processes(self, processes: List[Tuple], sort_by: str, limit: int = 10):
+        """Show the processes using the most CPU or memory"""
+        if sort_by == "cpu":
+            top = heapq.nlargest(limit, processes, key=lambda row: row[2])
+            self.print_table("Top CPU consumers", ["Name", "PID", "CPU (%)", "Memory (MB)"],
+                             [(name, pid, f"{cpu:.1f}", f"{mem:.2f}") for name, pid, cpu, mem in top])
+        else:
+            top = heapq.nlargest(limit, processes, key=lambda row: row[3])
+            self.print_table("Top memory consumers", ["Name", "PID", "Memory (MB)"],
+                             [(name, pid, f"{mem:.2f}") for name, pid, _, mem in top])
+    
+    def show_cpu_usage(self, cpu_percent: float):
+        """Show the overall CPU usage and system load"""
+        import psutil
+        print(f"{Fore.YELLOW}Current CPU usage:{Style.RESET_ALL}")
+        print(f"CPU usage: {cpu_percent:.2f}% ({psutil.cpu_count()} logical CPUs)")
+        if hasattr(os, "getloadavg"):
+            load_1, load_5, load_15 = os.getloadavg()
+            print(f"System load: {load_1:.2f}, {load_5:.2f}, {load_15:.2f}")
+    
+    def show_memory_usage(self):
+        """Show the current physical memory usage"""
+        import psutil
+        memory = psutil.virtual_memory()
+        mb = 1024 * 1024
+        self.print_table("Memory usage", ["Total (MB)", "Available (MB)", "Used (MB)", "Usage (%)"],
+                         [(f"{memory.total / mb:.2f}", f"{memory.available / mb:.2f}",
+                           f"{(memory.total - memory.available) / mb:.2f}", f"{memory.percent:.2f}")])
+    
+    def create_prompt_session(self):
+        """Create a prompt_toolkit session for line editing and history search, or None to use input()"""
+        if not HAS_PROMPT_TOOLKIT or self.config.get("use_standard_input", False):
+            return None
+        # prompt_toolkit needs a real terminal on both ends
+        if not (sys.stdin.isatty() and sys.stdout.isatty()):
+            return None
+        history = InMemoryHistory()
+        for cmd in self.command_history:
+            if isinstance(cmd, str):
+                history.append_string(cmd)
+        return PromptSession(
+            history=history,
+            enable_history_search=self.config.get("enable_command_history_search", True)
+        )
     
     def run(self):
         """Run the agent terminal in interactive mode"""
+        session = self.create_prompt_session()
         while True:
             try:
                 print()
-                user_input = input("What would you like me to do?\n")
+                if session is not None:
+                    user_input = session.prompt("What would you like me to do?\n> ")
+                else:
+                    user_input = input("What would you like me to do?\n")
                 if not self.process_user_input(user_input):
                     break
             except KeyboardInterrupt:
@@ -623,242 +1607,175 @@ Remember:
         """Load configuration from config.yaml"""
         try:
             if os.path.exists("config.yaml"):
-                with open("config.yaml") as f:
-                    return yaml.safe_load(f)
+                # Copied so one instance's changes don't leak into the cached parse
+                return dict(_parse_config_file("config.yaml", os.path.getmtime("config.yaml")))
             return {
                 "max_history": 100,
-                "history_file": "command_history.json",
+                "history_file": "command_history.jsonl",
                 "max_tokens": 8000
             }
         except Exception as e:
             print(f"Error loading config: {str(e)}")
             return {
                 "max_history": 100,
-                "history_file": "command_history.json",
+                "history_file": "command_history.jsonl",
                 "max_tokens": 8000
             }
             
     def load_history(self):
-        """Load command history from file"""
+        """Load command history from file (one JSON entry per line)"""
+        history_file = self.config["history_file"]
+        # Set when the file couldn't be read or repaired, so saves leave it untouched
+        self._history_locked = False
+        self.command_history = []
+        rewrite = False
         try:
-            if os.path.exists(self.config["history_file"]):
-                with open(self.config["history_file"], 'r') as f:
-                    self.command_history = json.load(f)
+            source = history_file
+            if not os.path.exists(source) and source.endswith(".jsonl") and os.path.exists(source[:-1]):
+                # History kept under the pre-JSON Lines name is carried over once
+                source = source[:-1]
+            if os.path.exists(source):
+                self.command_history, rewrite = read_history_file(source)
+                rewrite = rewrite or source != history_file
                 if not self.silent_init:
                     print(f"Loaded {len(self.command_history)} command(s) from history.")
             else:
                 if not self.silent_init:
-                    print(f"History file {self.config['history_file']} not found. Creating empty history.")
-                self.command_history = []
+                    print(f"History file {history_file} not found. Creating empty history.")
         except Exception as e:
             if not self.silent_init:
                 print(f"Error loading history: {str(e)}")
             self.command_history = []
+            self._history_locked = True
+        
+        # Everything loaded from disk is already saved
+        self._history_saved = len(self.command_history)
+        self._history_lines = self._history_saved
+        # Legacy or damaged files are rewritten as clean JSON Lines before anything is appended
+        if rewrite or self._history_lines > 2 * self.config.get("max_history", 100):
+            if not self.compact_history() and rewrite:
+                self._history_locked = True
             
     def save_history(self):
-        """Save command history to file"""
+        """Append commands not yet written to the history file"""
+        # Nothing new since the last save, or the file couldn't be read and must not be appended to
+        if self._history_locked or self._history_saved >= len(self.command_history):
+            return
         try:
-            with open(self.config["history_file"], 'w') as f:
-                json.dump(self.command_history, f, indent=2)
+            with open(self.config["history_file"], 'ab') as f:
+                for cmd in self.command_history[self._history_saved:]:
+                    f.write(_json_dumps(cmd))
+            self._history_lines += len(self.command_history) - self._history_saved
+            self._history_saved = len(self.command_history)
             if not self.silent_init:
                 print("History saved successfully.")
         except Exception as e:
             if not self.silent_init:
                 print(f"Error saving history: {str(e)}")
+            return
+        # The file only grows between compactions, so rewrite it once it holds twice the limit
+        if self._history_lines > 2 * self.config.get("max_history", 100):
+            self.compact_history()
     
-    def get_system_drive_info(self) -> Dict:
-        """Get information about system drives and common installation directories"""
-        drive_info = {}
+    def compact_history(self) -> bool:
+        """Rewrite the history file with only the newest max_history entries"""
+        if self._history_locked:
+            return False
+        history_file = self.config["history_file"]
+        keep = self.command_history[-max(1, self.config.get("max_history", 100)):]
         try:
-            # Get all drives on Windows
-            if platform.system() == "Windows":
-                import win32api
-                drives = win32api.GetLogicalDriveStrings().split('\000')[:-1]
-                for drive in drives:
-                    try:
-                        drive_info[drive] = {
-                            "type": "fixed" if drive.startswith("C:") else "removable",
-                            "free_space": win32api.GetDiskFreeSpace(drive)[0] * win32api.GetDiskFreeSpace(drive)[1] * win32api.GetDiskFreeSpace(drive)[2],
-                            "total_space": win32api.GetDiskFreeSpace(drive)[0] * win32api.GetDiskFreeSpace(drive)[1] * win32api.GetDiskFreeSpace(drive)[3]
-                        }
-                    except Exception:
-                        # If we can't get detailed info, just mark it as available
-                        drive_info[drive] = {"type": "available"}
+            tmp_file = history_file + ".tmp"
+            with open(tmp_file, 'wb') as f:
+                f.write(b"".join(_json_dumps(cmd) for cmd in keep))
+            os.replace(tmp_file, history_file)
         except Exception as e:
-            print(f"Warning: Could not get detailed drive information: {str(e)}")
-            # Fallback to basic drive detection
-            if platform.system() == "Windows":
-                import string
-                for letter in string.ascii_uppercase:
-                    drive = f"{letter}:\\"
-                    if os.path.exists(drive):
-                        drive_info[drive] = {"type": "available"}
-        
-        # Add common installation directories
-        common_dirs = {
-            "Program Files": os.path.join(os.environ.get("ProgramFiles", "C:\\Program Files")),
-            "Program Files (x86)": os.path.join(os.environ.get("ProgramFiles(x86)", "C:\\Program Files (x86)")),
-            "AppData": os.path.join(os.environ.get("APPDATA", os.path.expanduser("~\\AppData\\Roaming"))),
-            "Local AppData": os.path.join(os.environ.get("LOCALAPPDATA", os.path.expanduser("~\\AppData\\Local"))),
-            "Downloads": os.path.join(os.path.expanduser("~"), "Downloads"),
-            "Desktop": os.path.join(os.path.expanduser("~"), "Desktop"),
-            "Documents": os.path.join(os.path.expanduser("~"), "Documents")
-        }
-        
-        drive_info["common_dirs"] = common_dirs
-        return drive_info
+            if not self.silent_init:
+                print(f"Error compacting history: {str(e)}")
+            return False
+        self.command_history = keep
+        self._history_saved = len(keep)
+        self._history_lines = len(keep)
+        return True
+    
+    def get_system_drive_info(self) -> Dict:
+        """Get information about system drives and common installation directories"""
+        return get_drive_info()
 
-    def verify_command_execution(self, command: str, result: Dict) -> Tuple[bool, str, Dict]:
+    def verify_command_execution(self, command: str, result: Dict, task: str = "", subtask: str = "",
+                                 next_subtask: Optional[str] = None) -> Tuple[bool, str, Dict]:
         """Verify command execution using Gemini API"""
-        prompt = f"""
-# COMMAND EXECUTION VERIFICATION
-
-## COMMAND CONTEXT
-Command: {command}
-Exit Code: {result.get('exit_code', 1)}
-Output:
-{result.get('stdout', '')}
-Errors:
-{result.get('stderr', '')}
-
-## INSTRUCTIONS
-Analyze the command execution result and determine:
-1. Was the command successful?
-2. What is the current state of the system?
-3. What should be the next action?
-
-Return a JSON object with this structure:
-{{
-    "success": true/false,
-    "system_state": "description of current state",
-    "next_action": {{
-        "action": "continue/retry/skip/abort",
-        "reason": "why this action was chosen",
-        "fallback_command": "alternative command if retrying"
-    }},
-    "diagnostics": {{
-        "is_installed": true/false,
-        "error_type": "none/not_found/permission/network/etc",
-        "suggested_fix": "what needs to be done"
-    }}
-}}
-"""
+        # The plan context lets the same reply say whether to go on if the subtask fails
+        prompt = VERIFY_PROMPT_TEMPLATE.format(
+            command=command,
+            exit_code=result.get('exit_code', 1),
+            stdout=tail_text(result.get('stdout', '')),
+            stderr=tail_text(result.get('stderr', '')),
+            task=task,
+            subtask=subtask,
+            next_subtask=next_subtask or "None"
+        )
+        # Default values in case the API call fails
+        default_success = result.get('exit_code', 1) == 0
+        default_state = "Command executed, but verification unavailable."
+        default_action = {"action": "continue" if default_success else "skip", 
+                          "reason": "API verification unavailable, decision based on exit code"}
+        default_diagnostics = {"is_installed": None, "error_type": None, "suggested_fix": None}
+        
+        # Try to call the Gemini API with a timeout
         try:
-            # Default values in case the API call fails
-            default_success = result.get('exit_code', 1) == 0
-            default_state = "Command executed, but verification unavailable."
-            default_action = {"action": "continue" if default_success else "skip", 
-                              "reason": "API verification unavailable, decision based on exit code"}
-            default_diagnostics = {"is_installed": None, "error_type": None, "suggested_fix": None}
+            text = generate_text(prompt).strip()
             
-            # Try to call the Gemini API with a timeout
-            try:
-                response = MODEL.generate_content(prompt)
-                text = response.text.strip()
-                
-                # Extract JSON from response
-                match = re.search(r'```json\s*({.*?})\s*```', text, re.DOTALL)
-                if match:
-                    json_str = match.group(1)
-                else:
-                    match = re.search(r'({.*})', text, re.DOTALL)
-                    if match:
-                        json_str = match.group(1)
-                    else:
-                        json_str = text
-                
-                verification = json.loads(json_str)
-                return (
-                    verification.get("success", False),
-                    verification.get("system_state", ""),
-                    verification.get("next_action", {}),
-                    verification.get("diagnostics", {})
-                )
+            # Extract JSON from response
+            verification = parse_json_response(text)
+            return (
+                verification.get("success", False),
+                verification.get("system_state", ""),
+                verification.get("next_action", {}),
+                verification.get("diagnostics", {})
+            )
+        
+        except KeyboardInterrupt:
+            print(f"{Fore.YELLOW}\nVerification interrupted. Proceeding with basic verification.{Style.RESET_ALL}")
+            return default_success, default_state, default_action, default_diagnostics
             
-            except KeyboardInterrupt:
-                print(f"{Fore.YELLOW}\nVerification interrupted. Proceeding with basic verification.{Style.RESET_ALL}")
-                return default_success, default_state, default_action, default_diagnostics
-                
-            except Exception as e:
-                print(f"{Fore.YELLOW}API verification failed: {str(e)}. Using basic verification.{Style.RESET_ALL}")
-                return default_success, default_state, default_action, default_diagnostics
-                
         except Exception as e:
-            print(f"{Fore.RED}Error verifying command execution: {str(e)}{Style.RESET_ALL}")
-            return (
-                result.get('exit_code', 1) == 0,  # Consider success based on exit code
-                "",
-                {"action": "continue", "reason": "Verification failed"},
-                {}
-            )
+            print(f"{Fore.YELLOW}API verification failed: {str(e)}. Using basic verification.{Style.RESET_ALL}")
+            return default_success, default_state, default_action, default_diagnostics
+
+    def get_continuation_decision(self, failed_subtask: str, next_subtask: str, system_state: str) -> Optional[Dict]:
+        """Ask whether to go on after a failed subtask (None if the decision could not be made)"""
+        prompt = CONTINUATION_PROMPT_TEMPLATE.format(
+            failed_subtask=failed_subtask,
+            next_subtask=next_subtask,
+            system_state=system_state
+        )
+        try:
+            response = MODEL.generate_content(prompt)
+            text = response.text.strip()
+            
+            # Extract JSON from response
+            return parse_json_response(text)
+        except Exception as e:
+            print(f"{Fore.RED}Error making continuation decision: {str(e)}{Style.RESET_ALL}")
+            return None
 
     def get_task_planning(self, task: str) -> Dict:
         """Get AI task planning response - breaking the task into subtasks with approaches"""
-        # Get system drive information
-        drive_info = self.get_system_drive_info()
-        
-        prompt = f"""
-# TASK PLANNING AND ANALYSIS AGENT
-
-## CONTEXT INFORMATION
-- User Task: {task}
-- Current Directory: {self.context.current_directory}
-- OS: {platform.system()} {platform.release()}
-- System Drives: {json.dumps(drive_info, indent=2)}
-- Previous Commands: {', '.join([cmd.get('command', '') for cmd in self.context.command_history[-5:]])}
-
-## INSTRUCTIONS
-Analyze the user's task and create a structured execution plan:
-
-1. Break down the task into logical subtasks
-2. For each subtask, explain:
-   - What commands/approach you'll use
-   - Why this approach is optimal
-   - Any potential issues to watch for
-   - Required system resources or dependencies
-
-Return a JSON object with this structure:
-{{
-  "task_summary": "Brief summary of what you understand the task to be",
-  "subtasks": [
-    {{
-      "description": "Subtask description",
-      "approach": "How you will accomplish this subtask",
-      "commands": ["command1", "command2"],
-      "rationale": "Why this approach is best",
-      "potential_issues": "What might go wrong",
-      "required_resources": ["resource1", "resource2"],
-      "fallback_commands": ["fallback1", "fallback2"]
-    }}
-  ],
-  "estimated_steps": 5,
-  "system_requirements": {{
-    "disk_space": "required space",
-    "memory": "required memory",
-    "dependencies": ["dep1", "dep2"]
-  }}
-}}
-"""
+        # Only the task, directory and recent commands change between calls
+        recent_commands = ', '.join(self.context.recent_commands)
+        prompt = "".join([
+            PLAN_PROMPT_HEADER, task,
+            "\n- Current Directory: ", self.context.current_directory,
+            "\n- OS: ", PLATFORM_STR,
+            "\n- System Drives and Directories:\n", get_drive_info_text(),
+            "\n- Previous Commands: ", recent_commands,
+            PLAN_PROMPT_FOOTER
+        ])
         
         try:
-            response = MODEL.generate_content(prompt)
             # Extract JSON from response
-            text = response.text
-            
-            # Find JSON object in the response
-            match = re.search(r'```json\s*({.*?})\s*```', text, re.DOTALL)
-            if match:
-                json_str = match.group(1)
-            else:
-                # Try to find JSON without markdown formatting
-                match = re.search(r'({.*})', text, re.DOTALL)
-                if match:
-                    json_str = match.group(1)
-                else:
-                    json_str = text
-                    
-            # Clean and parse JSON
-            return json.loads(json_str)
+            text = generate_text(prompt, cache=True)
+            return parse_json_response(text)
         except Exception as e:
             print(f"Error generating task plan: {str(e)}")
             # Return simple fallback plan
@@ -885,172 +1802,69 @@ Return a JSON object with this structure:
     
     def get_command_generation(self, task: str, subtask: str = None) -> List[str]:
         """Get AI generated commands for a specific task or subtask"""
-        
+        return list(self.get_command_generation_stream(task, subtask))
+    
+    def command_generation_prompt(self, task: str, subtask: str = None) -> Optional[str]:
+        """Build the command generation prompt for a task or subtask (None for live monitoring, which uses fixed commands)"""
         # Prepare context for the prompt
         task_context = task
         if subtask:
             task_context = f"{task} - Subtask: {subtask}"
-            
-        recent_commands = "\n".join([f"- {cmd.get('command', '')}" for cmd in self.context.command_history[-5:]])
-        recent_errors = "\n".join([f"- Command: {cmd}, Error: {err}" for cmd, err in self.context.recent_errors[-3:]])
         
         # Special handling for real-time monitoring
-        if ("real-time" in task_context.lower() or "monitor" in task_context.lower()) and \
-           ("cpu" in task_context.lower() or "memory" in task_context.lower() or "system" in task_context.lower()):
-            
-            if platform.system() == "Windows":
-                return [
-                    # Limited samples instead of continuous for stable execution
-                    "powershell -Command \"Get-Counter '\\Processor(_Total)\\% Processor Time', '\\Memory\\% Committed Bytes In Use' -SampleInterval 1 -MaxSamples 10 | Format-Table -AutoSize\"",
-                    "powershell -Command \"Get-Process | Sort-Object -Property CPU -Descending | Select-Object -First 10 Name, CPU, WorkingSet, ID | Format-Table -AutoSize\""
-                ]
-            else:
-                # Linux commands
-                return [
-                    "top -n 10 -b",
-                    "free -m",
-                    "ps aux --sort=-%cpu | head -n 11"
-                ]
-        
-        prompt = f"""
-# TERMINAL COMMAND GENERATOR
-
-## CONTEXT
-- Task: {task_context}
-- Current Directory: {self.context.current_directory}
-- OS: {platform.system()} {platform.release()}
-- Recent Commands:
-{recent_commands}
-- Recent Errors:
-{recent_errors}
-
-## INSTRUCTIONS
-Generate the most efficient terminal commands to accomplish this task.
-Return ONLY raw, executable commands with NO explanations or formatting.
-Ensure commands are appropriate for the user's operating system.
-
-### WINDOWS GUIDELINES
-- Use PowerShell for complex tasks
-- Use CMD for simple tasks
-- Avoid continuous monitoring commands that run indefinitely
-- For PowerShell commands that typically would use -Continuous flag, use -MaxSamples 10 instead
-- For complex PowerShell commands, use: powershell -Command "Your-Command-Here"
-
-### RETURN FORMAT
-Return ONLY the raw commands, one per line, with NO explanations, backticks, or markdown.
-"""
+        if (match_term_flags(task_context.lower()) & TERM_CMDGEN_LIVE) == TERM_CMDGEN_LIVE:
+            return None
         
-        # Generate a safe default command based on the task
-        is_windows = platform.system() == "Windows"
-        default_commands = []
-        
-        # Simple command generation based on keywords in the task
-        if "file" in task_context.lower() or "list" in task_context.lower():
-            default_commands = ["dir"] if is_windows else ["ls -la"]
-        elif "process" in task_context.lower():
-            default_commands = ["tasklist"] if is_windows else ["ps aux"]
-        elif "network" in task_context.lower():
-            default_commands = ["ipconfig /all"] if is_windows else ["ifconfig"]
-        elif "system" in task_context.lower() or "info" in task_context.lower():
-            default_commands = ["systeminfo"] if is_windows else ["uname -a && cat /etc/os-release"]
-        elif "cpu" in task_context.lower() or "memory" in task_context.lower() or "monitor" in task_context.lower():
-            if is_windows:
-                default_commands = [
-                    "powershell -Command \"Get-Process | Sort-Object -Property CPU -Descending | Select-Object -First 10 Name, CPU, WorkingSet, ID | Format-Table -AutoSize\"",
-                    "powershell -Command \"Get-Counter '\\Processor(_Total)\\% Processor Time', '\\Memory\\% Committed Bytes In Use' -SampleInterval 1 -MaxSamples 10 | Format-Table -AutoSize\""
-                ]
-            else:
-                default_commands = ["top -n 10 -b", "free -m"]
-        else:
-            # Very safe fallback
-            default_commands = ["dir"] if is_windows else ["ls"]
+        return CMDGEN_PROMPT_TEMPLATE.format(
+            task_context=task_context,
+            current_directory=self.context.current_directory,
+            platform=PLATFORM_STR,
+            recent_commands="\n".join(self.context.recent_command_lines),
+            recent_errors="\n".join(self.context.recent_error_lines)
+        )
+    
+    def get_command_generation_stream(self, task: str, subtask: str = None, response: Optional[str] = None) -> Iterator[str]:
+        """Yield AI generated commands as each line of the response arrives, or from a response already received"""
+        context_lower = (f"{task} - Subtask: {subtask}" if subtask else task).lower()
+        prompt = self.command_generation_prompt(task, subtask)
+        if prompt is None:
+            yield from LIVE_MONITORING_COMMANDS
+            return
         
+        produced = 0
         try:
-            try:
-                response = MODEL.generate_content(prompt)
-                text = response.text.strip()
-                
-                # Clean up the response to remove any markdown formatting
-                text = re.sub(r'```(?:powershell|sh|bash|cmd|bat|shell)?\n', '', text)
-                text = re.sub(r'```', '', text)
-                
-                # Split into lines and remove empty lines
-                lines = [line.strip() for line in text.split('\n') if line.strip()]
+            for line in iter_lines([response] if response is not None else stream_text(prompt)):
+                # Remove any markdown code fences around the commands
+                line = _CODE_FENCE_RE.sub('', _CODE_FENCE_OPEN_RE.sub('', line + '\n'))
+                for command in clean_command_lines([line]):
+                    produced += 1
+                    yield command
                 
-                # Additional post-processing to ensure no markdown or explanations
-                commands = []
-                for line in lines:
-                    # Skip lines that look like markdown headings or bullet points
-                    if line.startswith('#') or line.startswith('-') or line.startswith('*'):
-                        continue
-                    # Skip lines that look like explanations
-                    if ('Note:' in line or 
-                        'This command' in line or 
-                        'Use this' in line or 
-                        line.startswith('Note') or 
-                        line.startswith('For') or 
-                        line.startswith('The') or
-                        line.startswith('This') or
-                        line.startswith('To ') or
-                        line.startswith('You can')):
-                        continue
-                    
-                    # Remove any remaining markdown or non-command elements
-                    line = re.sub(r'^[>#$] ', '', line)
-                    
-                    # Add to commands if it looks like an actual command
-                    if len(line.split()) >= 1:
-                        commands.append(line)
+            if not produced:
+                # Fallback if we couldn't extract commands
+                print(f"{Fore.YELLOW}No valid commands could be extracted from AI response. Using default commands.{Style.RESET_ALL}")
+                yield from get_default_commands(context_lower)
                 
-                # For real-time monitoring tasks, ensure we don't use continuous monitoring
-                if ("real-time" in task_context.lower() or "monitor" in task_context.lower()) and \
-                   ("cpu" in task_context.lower() or "memory" in task_context.lower() or "system" in task_context.lower()):
-                    commands = [cmd.replace("-Continuous", "-MaxSamples 10") for cmd in commands]
-                
-                # Final cleanup for PowerShell commands on Windows
-                final_commands = []
-                
-                for cmd in commands:
-                    # Fix PowerShell commands
-                    if is_windows and ('Get-' in cmd or 'Set-' in cmd or "$_" in cmd or 'Where-Object' in cmd):
-                        # If it's a PowerShell command but doesn't have the powershell -Command prefix
-                        if not cmd.startswith('powershell -Command') and not cmd.startswith('powershell.exe -Command'):
-                            if '"' in cmd:
-                                # If there are already quotes, we need to be careful with nesting
-                                cmd = f'powershell -Command "{cmd}"'
-                            else:
-                                # Simple case, just wrap in quotes
-                                cmd = f'powershell -Command "{cmd}"'
-                    
-                    final_commands.append(cmd)
-                    
-                if final_commands:
-                    return final_commands
-                else:
-                    # Fallback if we couldn't extract commands
-                    print(f"{Fore.YELLOW}No valid commands could be extracted from AI response. Using default commands.{Style.RESET_ALL}")
-                    return default_commands
-                    
-            except KeyboardInterrupt:
+        except KeyboardInterrupt:
+            if not produced:
                 print(f"{Fore.YELLOW}\nCommand generation interrupted. Using default commands.{Style.RESET_ALL}")
-                return default_commands
-                
-            except Exception as e:
-                print(f"{Fore.YELLOW}API command generation failed: {str(e)}. Using default commands.{Style.RESET_ALL}")
-                return default_commands
-                
+                yield from get_default_commands(context_lower)
+            
         except Exception as e:
-            print(f"{Fore.RED}Error generating commands: {str(e)}{Style.RESET_ALL}")
-            # Return a safe fallback command
-            return default_commands
+            # Commands already handed out may be running, so only fall back if there were none
+            if produced:
+                print(f"{Fore.YELLOW}API command generation stopped early: {str(e)}{Style.RESET_ALL}")
+            else:
+                print(f"{Fore.YELLOW}API command generation failed: {str(e)}. Using default commands.{Style.RESET_ALL}")
+                yield from get_default_commands(context_lower)
     
     def execute_command(self, command: str) -> Dict:
         """Execute a command and return its result"""
         # Special handling for common tasks on Windows
-        if platform.system() == "Windows":
+        if IS_WINDOWS:
             # Handle "find large files" command for Windows
-            if re.search(r"find.*files.*larger than.*MB", command.lower()):
-                size_match = re.search(r"(\d+)\s*MB", command.lower())
+            if _LARGE_FILES_RE.search(command):
+                size_match = _SIZE_MB_RE.search(command)
                 size_mb = "10"  # Default size
                 
                 if size_match:
@@ -1058,7 +1872,7 @@ Return ONLY the raw commands, one per line, with NO explanations, backticks, or
                 
                 # Execute PowerShell directly
                 print(f"{Fore.CYAN}Executing direct PowerShell command for finding large files...{Style.RESET_ALL}")
-                command = f'powershell -Command "Get-ChildItem -Path . -Recurse -File | Where-Object {{ $_.Length -gt ({size_mb} * 1MB) }} | Sort-Object Length -Descending | Select-Object @{{Name=\'Size (MB)\';Expression={{[math]::Round($_.Length / 1MB, 2)}}}}, FullName | Format-Table -AutoSize"'
+                command = f'powershell -NoProfile -NonInteractive -Command "Get-ChildItem -Path . -Recurse -File | Where-Object {{ $_.Length -gt ({size_mb} * 1MB) }} | Sort-Object Length -Descending | Select-Object @{{Name=\'Size (MB)\';Expression={{[math]::Round($_.Length / 1MB, 2)}}}}, FullName | Format-Table -AutoSize"'
             
             # Special handling for real-time monitoring commands
             if ("Get-Counter" in command or 
@@ -1080,146 +1894,105 @@ Return ONLY the raw commands, one per line, with NO explanations, backticks, or
         # Original command execution code continues here
         print(f"{Fore.YELLOW}Executing: {command}{Style.RESET_ALL}")
         
+        # Wall-clock time for the record, monotonic time for the duration
+        timestamp = time.time_ns()
+        start_time = time.monotonic()
+        
         command_data = {
             "command": command,
             "stdout": "",
             "stderr": "",
             "exit_code": 0,
             "execution_time": 0,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": timestamp
         }
         
         # Add command to task if we're in a task
         if hasattr(self, 'context') and hasattr(self.context, 'current_task') and self.context.current_task:
             self.context.add_command_to_current_task(command_data)
         
-        start_time = time.time()
-        
-        # For cd commands, use our internal method
-        if command.strip().startswith("cd "):
-            path = command[3:].strip()
-            if path:
-                self.change_directory(path)
-                return {
-                    "command": command,
-                    "stdout": f"Changed directory to {self.context.current_directory}",
-                    "stderr": "",
-                    "exit_code": 0,
-                    "execution_time": time.time() - start_time,
-                    "timestamp": datetime.now().isoformat()
-                }
-            else:
-                # Just "cd" with no args usually goes to home directory
-                self.change_directory("~")
-                return {
-                    "command": command,
-                    "stdout": f"Changed directory to {self.context.current_directory}",
-                    "stderr": "",
-                    "exit_code": 0,
-                    "execution_time": time.time() - start_time,
-                    "timestamp": datetime.now().isoformat()
-                }
+        # Shell builtins that must change our own state (like cd) are handled internally
+        parts = command.split(None, 1)
+        handler = AgentTerminal.BUILTIN_HANDLERS.get(parts[0]) if parts else None
+        if handler is not None:
+            stdout = handler(self, parts[1].strip() if len(parts) > 1 else "")
+            return {
+                "command": command,
+                "stdout": stdout,
+                "stderr": "",
+                "exit_code": 0,
+                "execution_time": time.monotonic() - start_time,
+                "timestamp": timestamp
+            }
         
         try:
-            # Execute the command
+            # Execute the command; quoted PowerShell one-liners skip the intermediate shell
+            popen_args = powershell_argv(command) if IS_WINDOWS else None
             process = subprocess.Popen(
-                command,
-                shell=True,
+                popen_args or command,
+                shell=popen_args is None,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
-                text=True,
+                # POSIX pipes are read as raw bytes and decoded line by line
+                text=IS_WINDOWS,
                 cwd=self.context.current_directory
             )
             
             # Stream output in real-time
-            stdout_lines = []
-            stderr_lines = []
-            
-            # Set a timeout value for each readline operation
-            import select
-            
-            # Read stdout and stderr in real-time with timeout support
-            while True:
+            stdout_buf = io.StringIO()
+            stderr_buf = io.StringIO()
+            try:
+                if IS_WINDOWS:
+                    open_streams = self.pump_output_threads(process, stdout_buf, stderr_buf)
+                else:
+                    open_streams = self.pump_output_selector(process, stdout_buf, stderr_buf)
+            except KeyboardInterrupt:
+                print(f"{Fore.YELLOW}\nCommand interrupted by user. Terminating...{Style.RESET_ALL}")
                 try:
-                    # Check if the process has already exited
-                    if process.poll() is not None:
-                        break
-                    
-                    # Use select to wait for output with a timeout
-                    readable, _, _ = select.select([process.stdout, process.stderr], [], [], 0.1)
-                    
-                    for stream in readable:
-                        if stream == process.stdout:
-                            stdout_line = process.stdout.readline()
-                            if stdout_line:
-                                stdout_line = stdout_line.rstrip()
-                                print(stdout_line)
-                                stdout_lines.append(stdout_line)
-                        elif stream == process.stderr:
-                            stderr_line = process.stderr.readline()
-                            if stderr_line:
-                                stderr_line = stderr_line.rstrip()
-                                print(f"{Fore.RED}{stderr_line}{Style.RESET_ALL}")
-                                stderr_lines.append(stderr_line)
-                    
-                except KeyboardInterrupt:
-                    print(f"{Fore.YELLOW}\nCommand interrupted by user. Terminating...{Style.RESET_ALL}")
-                    try:
-                        process.terminate()
-                        # Give it a chance to terminate gracefully
-                        process.wait(timeout=2)
-                    except:
-                        # If it doesn't terminate in time, kill it
-                        process.kill()
-                    
-                    return {
-                        "command": command,
-                        "stdout": '\n'.join(stdout_lines),
-                        "stderr": '\n'.join(stderr_lines) + "\nCommand interrupted by user",
-                        "exit_code": 130,  # Standard exit code for SIGINT
-                        "execution_time": time.time() - start_time,
-                        "timestamp": datetime.now().isoformat()
-                    }
-                except Exception as e:
-                    print(f"{Fore.RED}Error reading command output: {str(e)}{Style.RESET_ALL}")
-                    break
+                    process.terminate()
+                    # Give it a chance to terminate gracefully
+                    process.wait(timeout=2)
+                except:
+                    # If it doesn't terminate in time, kill it
+                    process.kill()
+                
+                return {
+                    "command": command,
+                    "stdout": stdout_buf.getvalue().rstrip(),
+                    "stderr": stderr_buf.getvalue() + "Command interrupted by user",
+                    "exit_code": 130,  # Standard exit code for SIGINT
+                    "execution_time": time.monotonic() - start_time,
+                    "timestamp": timestamp
+                }
             
-            # Get any remaining output
+            # Wait for the process to finish
             try:
-                remaining_stdout, remaining_stderr = process.communicate(timeout=5)
-                
-                if remaining_stdout:
-                    print(remaining_stdout.rstrip())
-                    stdout_lines.extend(remaining_stdout.rstrip().split('\n'))
-                
-                if remaining_stderr:
-                    print(f"{Fore.RED}{remaining_stderr.rstrip()}{Style.RESET_ALL}")
-                    stderr_lines.extend(remaining_stderr.rstrip().split('\n'))
+                process.wait(timeout=5 if open_streams else None)
             except subprocess.TimeoutExpired:
                 # Process didn't complete within timeout, kill it
                 process.kill()
-                remaining_stdout, remaining_stderr = process.communicate()
-                stderr_lines.append("Command timed out and was terminated")
+                process.wait()
+                stderr_buf.write("Command timed out and was terminated\n")
             
             exit_code = process.returncode
-            execution_time = time.time() - start_time
+            execution_time = time.monotonic() - start_time
             
             # Store the result
             result = {
                 "command": command,
-                "stdout": '\n'.join(stdout_lines),
-                "stderr": '\n'.join(stderr_lines),
+                "stdout": stdout_buf.getvalue().rstrip(),
+                "stderr": stderr_buf.getvalue().rstrip(),
                 "exit_code": exit_code,
                 "execution_time": execution_time,
-                "timestamp": datetime.now().isoformat()
+                "timestamp": timestamp
             }
             
             # Add to context
             self.context.add_command_to_current_task(result)
             
             # If there was an error, add to recent errors
-            if exit_code != 0 and stderr_lines:
-                self.context.recent_errors.append((command, '\n'.join(stderr_lines)))
+            if exit_code != 0 and result["stderr"]:
+                self.context.add_recent_error(command, result["stderr"])
             
             # Print a completion message
             if exit_code == 0:
@@ -1239,8 +2012,8 @@ Return ONLY the raw commands, one per line, with NO explanations, backticks, or
                 "stdout": "",
                 "stderr": error_msg,
                 "exit_code": 130,  # Standard exit code for SIGINT
-                "execution_time": time.time() - start_time,
-                "timestamp": datetime.now().isoformat()
+                "execution_time": time.monotonic() - start_time,
+                "timestamp": timestamp
             }
             
             return result
@@ -1254,20 +2027,152 @@ Return ONLY the raw commands, one per line, with NO explanations, backticks, or
                 "stdout": "",
                 "stderr": error_msg,
                 "exit_code": 1,
-                "execution_time": time.time() - start_time,
-                "timestamp": datetime.now().isoformat()
+                "execution_time": time.monotonic() - start_time,
+                "timestamp": timestamp
             }
             
             self.context.add_command_to_current_task(result)
-            self.context.recent_errors.append((command, error_msg))
+            self.context.add_recent_error(command, error_msg)
             return result
     
+    def emit_output_line(self, stream_name: str, line: str, stdout_buf: io.StringIO, stderr_buf: io.StringIO):
+        """Show one line of command output and record it in the matching buffer"""
+        if stream_name == "stdout":
+            line = line.rstrip() + "\n"
+            sys.stdout.write(line)
+            stdout_buf.write(line)
+        else:
+            line = line.rstrip()
+            sys.stdout.write(f"{Fore.RED}{line}{Style.RESET_ALL}\n")
+            stderr_buf.write(line + "\n")
+    
+    def pump_output_threads(self, process, stdout_buf: io.StringIO, stderr_buf: io.StringIO) -> int:
+        """Stream a process's text pipes through one reader thread each; returns the pipes left open"""
+        output_queue = queue.Queue()
+        readers = [
+            threading.Thread(target=self.read_stream, args=(process.stdout, "stdout", output_queue), daemon=True),
+            threading.Thread(target=self.read_stream, args=(process.stderr, "stderr", output_queue), daemon=True)
+        ]
+        for reader in readers:
+            reader.start()
+        
+        # Read until both pipes close, or give up shortly after the process exits
+        # if something it spawned keeps the pipes open
+        open_streams = len(readers)
+        exit_deadline = None
+        while open_streams:
+            try:
+                try:
+                    stream_name, line = output_queue.get(timeout=0.5)
+                except queue.Empty:
+                    if process.poll() is not None:
+                        if exit_deadline is None:
+                            exit_deadline = time.monotonic() + 5
+                        elif time.monotonic() > exit_deadline:
+                            break
+                    continue
+                
+                if line is None:
+                    open_streams -= 1
+                else:
+                    self.emit_output_line(stream_name, line, stdout_buf, stderr_buf)
+                
+                # Flush once the burst of queued output has been written
+                if output_queue.empty():
+                    sys.stdout.flush()
+            except KeyboardInterrupt:
+                raise
+            except Exception as e:
+                print(f"{Fore.RED}Error reading command output: {str(e)}{Style.RESET_ALL}")
+                break
+        return open_streams
+    
+    def pump_output_selector(self, process, stdout_buf: io.StringIO, stderr_buf: io.StringIO) -> int:
+        """Stream a process's byte pipes with one selector in this thread; returns the pipes left open"""
+        encoding = locale.getpreferredencoding(False)
+        pending = {"stdout": b"", "stderr": b""}
+        with selectors.DefaultSelector() as selector:
+            selector.register(process.stdout, selectors.EVENT_READ, "stdout")
+            selector.register(process.stderr, selectors.EVENT_READ, "stderr")
+            
+            # Read until both pipes close, or give up shortly after the process exits
+            # if something it spawned keeps the pipes open
+            exit_deadline = None
+            while selector.get_map():
+                try:
+                    events = selector.select(timeout=0.5)
+                    if not events:
+                        if process.poll() is not None:
+                            if exit_deadline is None:
+                                exit_deadline = time.monotonic() + 5
+                            elif time.monotonic() > exit_deadline:
+                                break
+                        continue
+                    
+                    for key, _ in events:
+                        stream_name = key.data
+                        chunk = os.read(key.fd, 65536)
+                        if not chunk:
+                            selector.unregister(key.fileobj)
+                            data, pending[stream_name] = pending[stream_name], b""
+                        else:
+                            # Only complete lines are shown; a trailing \r may still be part of \r\n
+                            data = pending[stream_name] + chunk
+                            cut = max(data.rfind(b"\n"), data.rfind(b"\r", 0, len(data) - 1)) + 1
+                            data, pending[stream_name] = data[:cut], data[cut:]
+                        if not data:
+                            continue
+                        if stream_name == "stdout":
+                            # Whole block at once: decode, trim each line's trailing whitespace
+                            # and write it to the terminal and the buffer in one go
+                            text = data.decode(encoding, errors="replace")
+                            if not text.endswith(("\n", "\r")):
+                                text += "\n"
+                            text = _LINE_END_RE.sub("\n", text)
+                            sys.stdout.write(text)
+                            stdout_buf.write(text)
+                        else:
+                            # bytes.splitlines breaks only on \n, \r and \r\n, like text-mode pipes
+                            for line in data.splitlines():
+                                self.emit_output_line(stream_name, line.decode(encoding, errors="replace"),
+                                                      stdout_buf, stderr_buf)
+                    sys.stdout.flush()
+                except KeyboardInterrupt:
+                    raise
+                except Exception as e:
+                    print(f"{Fore.RED}Error reading command output: {str(e)}{Style.RESET_ALL}")
+                    break
+            return len(selector.get_map())
+    
+    def read_stream(self, stream, stream_name: str, output_queue: "queue.Queue"):
+        """Forward lines from a process pipe to a queue, followed by None at end of stream"""
+        try:
+            for line in iter(stream.readline, ''):
+                output_queue.put((stream_name, line))
+        except (OSError, ValueError):
+            pass
+        finally:
+            output_queue.put((stream_name, None))
+    
+    def _builtin_cd(self, args: str) -> str:
+        """Handle cd; with no arguments it goes to the home directory"""
+        self.change_directory(args or "~")
+        return f"Changed directory to {self.context.current_directory}"
+    
+    def _builtin_pwd(self, args: str) -> str:
+        """Handle pwd by reporting the agent's own working directory"""
+        print(self.context.current_directory)
+        return self.context.current_directory
+    
+    # First word of a command -> handler returning the command's output
+    BUILTIN_HANDLERS = {"cd": _builtin_cd, "pwd": _builtin_pwd}
+    
     def change_directory(self, path: str):
         """Change the current directory"""
         try:
             # Handle home directory shorthand
             if path == "~":
-                path = os.path.expanduser("~")
+                path = _HOME
                 
             # Convert relative paths to absolute
             if not os.path.isabs(path):
@@ -1275,10 +2180,16 @@ Return ONLY the raw commands, one per line, with NO explanations, backticks, or
             else:
                 new_path = path
                 
-            # Resolve path to handle .. and .
-            new_path = os.path.normpath(os.path.abspath(new_path))
+            # Resolve path to handle .. and . (abspath also normalizes)
+            new_path = os.path.abspath(new_path)
+            
+            # A single stat tells us both whether it exists and whether it is a directory
+            try:
+                is_dir = stat.S_ISDIR(os.stat(new_path).st_mode)
+            except OSError:
+                is_dir = False
             
-            if os.path.exists(new_path) and os.path.isdir(new_path):
+            if is_dir:
                 os.chdir(new_path)
                 self.context.current_directory = new_path
                 print(f"{Fore.GREEN}Changed directory to: {self.context.current_directory}{Style.RESET_ALL}")
@@ -1311,11 +2222,16 @@ For any other tasks, simply describe what you want to do
             print(f"{Fore.YELLOW}No command history available{Style.RESET_ALL}")
             return
             
-        print(f"{Fore.CYAN}Command History:{Style.RESET_ALL}")
+        # Built up and written at once rather than one print per entry
+        lines = [f"{Fore.CYAN}Command History:{Style.RESET_ALL}"]
         for i, cmd in enumerate(self.command_history, 1):
-            status = f"{Fore.GREEN}Success{Style.RESET_ALL}" if cmd.get("exit_code", 1) == 0 else f"{Fore.RED}Failed ({cmd.get('exit_code')}){Style.RESET_ALL}"
-            execution_time = f"{cmd.get('execution_time', 0):.2f}s"
-            print(f"{i}. {cmd.get('command', '')} - {status} - {execution_time}")
+            # Inputs typed at the prompt are stored as plain strings
+            if isinstance(cmd, str):
+                lines.append(f"{i}. {cmd}")
+                continue
+            status = STATUS_SUCCESS if cmd.get("exit_code", 1) == 0 else STATUS_FAILED.format(cmd.get('exit_code'))
+            lines.append(f"{i}. {cmd.get('command', '')} - {status} - {cmd.get('execution_time', 0):.2f}s")
+        sys.stdout.write("\n".join(lines) + "\n")
     
     def display_task_status(self):
         """Display all tasks and their status"""
@@ -1323,11 +2239,11 @@ For any other tasks, simply describe what you want to do
             print(f"{Fore.YELLOW}No tasks have been started yet{Style.RESET_ALL}")
             return
         
-        print(f"{Fore.CYAN}Task Status:{Style.RESET_ALL}")
+        lines = [f"{Fore.CYAN}Task Status:{Style.RESET_ALL}"]
         for task in self.context.task_history:
-            print(f"{task}")
-            for subtask in task.subtasks:
-                print(f"  {subtask}")
+            lines.append(str(task))
+            lines.extend(f"  {subtask}" for subtask in task.subtasks)
+        sys.stdout.write("\n".join(lines) + "\n")
     
     def display_context(self):
         """Display current context information"""
@@ -1336,7 +2252,7 @@ For any other tasks, simply describe what you want to do
     
     def should_ask_question(self) -> bool:
         """Determine if the agent should ask a question based on probability"""
-        return random.random() < self.config.get("question_probability", 0.1)
+        return random.getrandbits(16) < self._question_threshold
     
     def ask_question(self, task: str, subtask: str = None) -> Optional[str]:
         """Generate and ask a clarifying question if necessary"""
@@ -1349,32 +2265,13 @@ For any other tasks, simply describe what you want to do
             context += f"\nSubtask: {subtask}"
             
         context += f"\nDirectory: {self.context.current_directory}"
-        context += f"\nPlatform: {platform.system()} {platform.release()}"
+        context += f"\nPlatform: {PLATFORM_STR}"
             
         # Generate a question
-        prompt = f"""
-# CLARIFICATION QUESTION GENERATION
-
-Given the following task context, determine if there's any critical information missing 
-to complete the task effectively. If there is, generate a single direct question to ask the user.
-If no question is needed, respond with "NO_QUESTION_NEEDED".
-
-## CONTEXT
-{context}
-
-## INSTRUCTIONS
-- Only ask if truly necessary for task completion
-- Ask about critical parameters, preferences, or constraints
-- Keep questions short and direct
-- If the task is clear and has sufficient information, return "NO_QUESTION_NEEDED"
-
-## OUTPUT FORMAT
-Return ONLY the question text or "NO_QUESTION_NEEDED", nothing else.
-"""
+        prompt = QUESTION_PROMPT_TEMPLATE.format(context=context)
         
         try:
-            response = MODEL.generate_content(prompt)
-            question = response.text.strip()
+            question = generate_text(prompt).strip()
             
             # Only ask if an actual question was generated
             if question and "NO_QUESTION_NEEDED" not in question:
@@ -1387,7 +2284,7 @@ Return ONLY the question text or "NO_QUESTION_NEEDED", nothing else.
             print(f"Error generating question: {str(e)}")
             return None
     
-    def search_for_installation(self, program_name: str) -> Dict:
+    def search_for_installation(self, program_name: str, include_removable: bool = False) -> Dict:
         """Search for an existing installation of a program"""
         print(f"{Fore.CYAN}Searching for existing installation of {program_name}...{Style.RESET_ALL}")
         
@@ -1395,15 +2292,10 @@ Return ONLY the question text or "NO_QUESTION_NEEDED", nothing else.
         drive_info = self.get_system_drive_info()
         common_dirs = drive_info.get("common_dirs", {})
         
-        # Common installation patterns
-        patterns = [
-            program_name.lower(),
-            program_name.lower() + ".exe",
-            program_name.lower() + ".msi",
-            program_name.lower() + ".zip",
-            program_name.lower() + "-*",  # For versioned folders
-            program_name.lower() + "*"    # Any folder starting with program name
-        ]
+        # Every installation pattern (name, name.exe/.msi/.zip, versioned name-* folders)
+        # contains the program name, so one substring test per entry covers them all
+        program_lower = program_name.lower()
+        exe_name = program_lower + ".exe"
         
         found_locations = []
         search_results = {
@@ -1414,90 +2306,100 @@ Return ONLY the question text or "NO_QUESTION_NEEDED", nothing else.
             "type": None  # "portable", "installed", "archive"
         }
         
-        # Search in common directories
+        # An executable is the best possible result, so all scans stop once one is seen
+        # (the event is also set to abandon the search early)
+        exe_found = threading.Event()
+        
+        def matches(name_lower: str) -> bool:
+            if program_lower not in name_lower:
+                return False
+            if name_lower.endswith(".exe"):
+                exe_found.set()
+            return True
+        
+        # Search common directories, then all drives
+        roots = []
         for dir_name, dir_path in common_dirs.items():
-            if not os.path.exists(dir_path):
-                continue
-            
-            print(f"Searching in {dir_name}...")
-            
-            # Search for exact matches
-            for root, dirs, files in os.walk(dir_path):
-                # Check directories
-                for dir_name in dirs:
-                    dir_lower = dir_name.lower()
-                    if any(pattern in dir_lower for pattern in patterns):
-                        full_path = os.path.join(root, dir_name)
-                        found_locations.append({
-                            "path": full_path,
-                            "type": "directory",
-                            "name": dir_name
-                        })
-            
-            # Check files
-            for file_name in files:
-                file_lower = file_name.lower()
-                if any(pattern in file_lower for pattern in patterns):
-                    full_path = os.path.join(root, file_name)
-                    found_locations.append({
-                        "path": full_path,
-                        "type": "file",
-                        "name": file_name
-                    })
-        
-        # Search in all drives
-        for drive in drive_info:
+            if os.path.exists(dir_path):
+                print(f"Searching in {dir_name}...")
+                roots.append(dir_path)
+        for drive, info in drive_info.items():
             if drive == "common_dirs":
                 continue
-            
+            # Network, optical and removable drives are skipped unless asked for
+            if info.get("type") not in LOCAL_DRIVE_TYPES and not include_removable:
+                continue
             print(f"Searching in drive {drive}...")
-            try:
-                for root, dirs, files in os.walk(drive):
-                    # Check directories
-                    for dir_name in dirs:
-                        dir_lower = dir_name.lower()
-                        if any(pattern in dir_lower for pattern in patterns):
-                            full_path = os.path.join(root, dir_name)
-                            found_locations.append({
-                                "path": full_path,
-                                "type": "directory",
-                                "name": dir_name
-                            })
-                    
-                    # Check files
-                    for file_name in files:
-                        file_lower = file_name.lower()
-                        if any(pattern in file_lower for pattern in patterns):
-                            full_path = os.path.join(root, file_name)
-                            found_locations.append({
-                                "path": full_path,
-                                "type": "file",
-                                "name": file_name
-                            })
-            except Exception as e:
-                print(f"Warning: Could not search drive {drive}: {str(e)}")
+            roots.append(drive)
+        
+        # Common directories usually sit under a drive root; they are scanned once as
+        # their own roots and every other scan leaves them out
+        root_keys = set()
+        unique_roots = []
+        for root in roots:
+            key = os.path.normcase(os.path.abspath(root))
+            if key not in root_keys:
+                root_keys.add(key)
+                unique_roots.append(root)
+        roots = unique_roots
+        skip_paths = frozenset(root_keys).union(SCAN_SKIP_PATHS)
+        
+        def scan_root(root: str) -> Tuple[List[Dict], int]:
+            """Consume one root's matches as they are found, keeping at most MAX_LOCATIONS"""
+            locations = []
+            total = 0
+            # Closed explicitly so the open directory handle is released as soon as we stop
+            with closing(_scan_tree(root, matches, stop=exe_found, skip_paths=skip_paths)) as scan:
+                for location in scan:
+                    total += 1
+                    # Classified once here; merging and analysis below reuse the flag
+                    location["is_exe"] = location["type"] == "file" and location["name_lower"].endswith(".exe")
+                    if location["is_exe"]:
+                        locations.append(location)
+                        break
+                    if len(locations) < MAX_LOCATIONS:
+                        locations.append(location)
+            return locations, total
+        
+        # Roots are independent and the scan is I/O bound, so walk them concurrently;
+        # each worker returns its own list and results are merged in root order
+        total_found = 0
+        if roots:
+            with ThreadPoolExecutor(max_workers=min(8, len(roots))) as executor:
+                try:
+                    for locations, total in executor.map(scan_root, roots):
+                        # Keep MAX_LOCATIONS overall, but never drop an executable
+                        for location in locations:
+                            if len(found_locations) < MAX_LOCATIONS or location["is_exe"]:
+                                found_locations.append(location)
+                        total_found += total
+                finally:
+                    # On Ctrl+C or an error, stop the other walks instead of waiting for them to finish
+                    exe_found.set()
         
         # Analyze results
         if found_locations:
             search_results["is_installed"] = True
             search_results["locations"] = found_locations
             
-            # Try to find the executable
-            for location in found_locations:
-                if location["type"] == "file" and location["name"].lower().endswith(".exe"):
-                    search_results["executable_path"] = location["path"]
-                    search_results["type"] = "installed"
-                    break
-                elif location["type"] == "file" and location["name"].lower().endswith(".zip"):
-                    search_results["type"] = "archive"
-                    break
-                elif location["type"] == "directory":
-                    # Check if it's a portable installation
-                    exe_path = os.path.join(location["path"], f"{program_name.lower()}.exe")
-                    if os.path.exists(exe_path):
-                        search_results["executable_path"] = exe_path
-                        search_results["type"] = "portable"
+            # Prefer an executable; archives and portable folders are only checked without one
+            executable = next((location for location in found_locations if location["is_exe"]), None)
+            if executable is not None:
+                search_results["executable_path"] = executable["path"]
+                search_results["type"] = "installed"
+            else:
+                for location in found_locations:
+                    if location["type"] == "file" and location["name_lower"].endswith(".zip"):
+                        search_results["type"] = "archive"
                         break
+                    elif location["type"] == "directory" and not location["scanned"]:
+                        # Check if it's a portable installation; scanned directories
+                        # are already known to hold no matching executable
+                        exe_path = os.path.join(location["path"], exe_name)
+                        if os.path.exists(exe_path):
+                            search_results["executable_path"] = exe_path
+                            search_results["type"] = "portable"
+                            break
         
         # Print results
         if search_results["is_installed"]:
@@ -1505,7 +2407,7 @@ Return ONLY the question text or "NO_QUESTION_NEEDED", nothing else.
             print(f"Type: {search_results['type']}")
             if search_results["executable_path"]:
                 print(f"Executable: {search_results['executable_path']}")
-            print(f"Total locations found: {len(found_locations)}")
+            print(f"Total locations found: {total_found}")
         else:
             print(f"{Fore.YELLOW}No existing installation found{Style.RESET_ALL}")
         
@@ -1569,6 +2471,21 @@ Return ONLY the question text or "NO_QUESTION_NEEDED", nothing else.
             if subtask.get('required_resources'):
                 print(f"  Required: {', '.join(subtask['required_resources'])}")
         
+        subtasks = task_plan['subtasks']
+        
+        # The first subtask's model request is sent while the auto-run countdown runs. Install
+        # subtasks are left out, since they need no commands if the package is already there.
+        early_generation = None
+        if (self.auto_run and self.auto_run_delay > 0 and subtasks and needs_generated_commands(subtasks[0])
+                and "install" not in subtasks[0]['description'].lower()):
+            prompt = self.command_generation_prompt(task, subtasks[0]['description'])
+            if prompt is not None:
+                executor = ThreadPoolExecutor(max_workers=1)
+                # The worker only makes the request; the reply is parsed and reported on this thread
+                early_generation = executor.submit(generate_text, prompt)
+                # The worker finishes the request on its own, even if the task is cancelled
+                executor.shutdown(wait=False)
+        
         # If auto-run is disabled, ask for confirmation
         should_run = True
         if not self.auto_run:
@@ -1583,11 +2500,18 @@ Return ONLY the question text or "NO_QUESTION_NEEDED", nothing else.
                 modifications = input(f"{Fore.CYAN}What modifications would you like to make?: {Style.RESET_ALL}")
                 print(f"{Fore.YELLOW}Adapting plan based on your feedback...{Style.RESET_ALL}")
                 print(f"{Fore.GREEN}Understood! Proceeding with modified approach.{Style.RESET_ALL}")
-        else:
+        elif self.auto_run_delay > 0:
             # With auto-run enabled, still give a chance to cancel
-            print(f"\n{Fore.CYAN}Auto-executing plan in 3 seconds (press Ctrl+C to cancel)...{Style.RESET_ALL}")
+            print(f"\n{Fore.CYAN}Auto-executing plan in {self.auto_run_delay:g} seconds (press Ctrl+C to cancel)...{Style.RESET_ALL}")
+            deadline = time.monotonic() + self.auto_run_delay
             try:
-                time.sleep(3)
+                if early_generation is not None:
+                    # Errors are reported when the commands are collected below
+                    try:
+                        early_generation.result(timeout=self.auto_run_delay)
+                    except Exception:
+                        pass
+                time.sleep(max(0.0, deadline - time.monotonic()))
             except KeyboardInterrupt:
                 print(f"{Fore.YELLOW}Task cancelled by user{Style.RESET_ALL}")
                 self.context.fail_current_task("User cancelled task")
@@ -1597,6 +2521,9 @@ Return ONLY the question text or "NO_QUESTION_NEEDED", nothing else.
         main_task_objective_achieved = False
         main_task_result = ""
         
+        # Check if task is to verify if something is installed
+        is_check_installation = _CHECK_INSTALL_RE.search(task) is not None
+        
         # Execute each subtask
         for i, subtask in enumerate(task_plan['subtasks'], 1):
             print(f"\n{Fore.BLUE}{'=' * 40}{Style.RESET_ALL}")
@@ -1608,42 +2535,35 @@ Return ONLY the question text or "NO_QUESTION_NEEDED", nothing else.
             
             # Handle file sorting task
             if "sort" in subtask['description'].lower() and "file" in subtask['description'].lower():
-                # Get folder structure from MCP
-                folder_structure = mcp.get_folder_structure(mcp.common_dirs["Downloads"])
-                analysis = mcp.analyze_files(mcp.common_dirs["Downloads"])
+                mcp = get_mcp()
+                downloads = mcp.common_dirs["Downloads"]
                 
+                # Only the files at the top of Downloads are sorted, so one non-recursive
+                # listing tells us both which folders are needed and what to move
+                try:
+                    with os.scandir(downloads) as entries:
+                        files = [(entry, EXT_TO_FOLDER.get(os.path.splitext(entry.name)[1].lower(), "Others"))
+                                 for entry in entries if entry.is_file(follow_symlinks=False)]
+                except OSError as e:
+                    print(f"{Fore.RED}Failed to read {downloads}: {str(e)}{Style.RESET_ALL}")
+                    self.context.fail_current_task(f"Could not list {downloads}")
+                    continue
+
                 # Create suggested folders
-                for folder, count in analysis["suggested_folders"].items():
-                    if count > 0:
-                        folder_path = os.path.join(mcp.common_dirs["Downloads"], folder)
-                        if mcp.create_folder(folder_path):
-                            print(f"{Fore.GREEN}Created folder: {folder}{Style.RESET_ALL}")
+                folder_paths = {folder: os.path.join(downloads, folder) for folder in SORT_FOLDERS}
+                needed = {target_folder for _, target_folder in files}
+                for folder in SORT_FOLDERS:
+                    if folder in needed and mcp.create_folder(folder_paths[folder]):
+                        print(f"{Fore.GREEN}Created folder: {folder}{Style.RESET_ALL}")
                 
-                # Move files to appropriate folders
-                for root, _, files in os.walk(mcp.common_dirs["Downloads"]):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        file_ext = os.path.splitext(file)[1].lower()
-                        
-                        # Determine target folder
-                        if file_ext in ['.jpg', '.jpeg', '.png', '.gif', '.bmp']:
-                            target_folder = "Images"
-                        elif file_ext in ['.mp4', '.avi', '.mov', '.wmv']:
-                            target_folder = "Videos"
-                        elif file_ext in ['.mp3', '.wav', '.flac']:
-                            target_folder = "Music"
-                        elif file_ext in ['.pdf', '.doc', '.docx', '.txt']:
-                            target_folder = "Documents"
-                        elif file_ext in ['.zip', '.rar', '.7z']:
-                            target_folder = "Archives"
-                        else:
-                            target_folder = "Others"
-                        
-                        # Move file if it's not already in the target folder
-                        target_path = os.path.join(mcp.common_dirs["Downloads"], target_folder, file)
-                        if os.path.dirname(file_path) != os.path.dirname(target_path):
-                            if mcp.move_file(file_path, target_path):
-                                print(f"{Fore.GREEN}Moved {file} to {target_folder}{Style.RESET_ALL}")
+                # Move the files into their folders; the category folders are never revisited
+                moved = []
+                for entry, target_folder in files:
+                    target_path = os.path.join(folder_paths[target_folder], entry.name)
+                    if mcp.move_file(entry.path, target_path):
+                        moved.append(MOVED_LINE.format(entry.name, target_folder))
+                if moved:
+                    sys.stdout.write("\n".join(moved) + "\n")
                 
                 # Delete empty folders
                 deleted = mcp.delete_empty_folders(mcp.common_dirs["Downloads"])
@@ -1659,6 +2579,7 @@ Return ONLY the question text or "NO_QUESTION_NEEDED", nothing else.
             if "install" in subtask['description'].lower():
                 # Extract program name from subtask description
                 program_name = subtask['description'].lower().replace("install", "").strip()
+                mcp = get_mcp()
                 
                 # Check if package manager is available
                 if not mcp.package_managers["chocolatey"]:
@@ -1681,20 +2602,30 @@ Return ONLY the question text or "NO_QUESTION_NEEDED", nothing else.
                     main_task_result = f"{program_name} is already installed"
                     break
             
-            # Check if task is to verify if something is installed
-            is_check_installation = any(word in task.lower() for word in ["check if", "verify if", "see if", "find out if", "is installed"])
-            is_program_related = any(word in subtask['description'].lower() for word in ["installed", "accessible", "available"])
+            is_program_related = _PROGRAM_RE.search(subtask['description']) is not None
             
             # Get commands for the subtask
             if subtask.get('commands') and len(subtask['commands']) > 0:
                 commands = subtask['commands']
             else:
-                commands = self.get_command_generation(task, subtask['description'])
+                commands = None
+                if i == 1 and early_generation is not None:
+                    try:
+                        response = early_generation.result()
+                    except Exception as e:
+                        print(f"{Fore.YELLOW}Command generation failed: {str(e)}. Trying again.{Style.RESET_ALL}")
+                    else:
+                        commands = list(self.get_command_generation_stream(task, subtask['description'], response))
+                # Other subtasks stream their commands so the first one runs while the rest are still generated
+                if commands is None:
+                    commands = prefetch(self.get_command_generation_stream(task, subtask['description']))
             
-            # Execute commands
+            # Execute commands (streamed commands have no known total)
+            next_subtask = subtasks[i]['description'] if i < len(subtasks) else None
             all_success = True
+            total = f"/{len(commands)}" if isinstance(commands, list) else ""
             for j, command in enumerate(commands, 1):
-                print(f"{Fore.CYAN}Command {j}/{len(commands)}: {command}{Style.RESET_ALL}")
+                print(f"{Fore.CYAN}Command {j}{total}: {command}{Style.RESET_ALL}")
                 
                 # If auto-run is disabled, ask confirmation for each command
                 if not self.auto_run:
@@ -1710,7 +2641,8 @@ Return ONLY the question text or "NO_QUESTION_NEEDED", nothing else.
                 result = self.execute_command(command)
                 
                 # Verify command execution with Gemini
-                success, system_state, next_action, diagnostics = self.verify_command_execution(command, result)
+                success, system_state, next_action, diagnostics = self.verify_command_execution(
+                    command, result, task, subtask['description'], next_subtask)
                 
                 # Print system state and diagnostics
                 if system_state:
@@ -1745,7 +2677,8 @@ Return ONLY the question text or "NO_QUESTION_NEEDED", nothing else.
                     if action == "retry" and fallback_cmd:
                         print(f"{Fore.CYAN}Trying fallback command: {fallback_cmd}{Style.RESET_ALL}")
                         result = self.execute_command(fallback_cmd)
-                        success, system_state, next_action, diagnostics = self.verify_command_execution(fallback_cmd, result)
+                        success, system_state, next_action, diagnostics = self.verify_command_execution(
+                            fallback_cmd, result, task, subtask['description'], next_subtask)
                         all_success = success
                     elif action == "skip":
                         print(f"{Fore.YELLOW}Skipping to next step.{Style.RESET_ALL}")
@@ -1758,6 +2691,10 @@ Return ONLY the question text or "NO_QUESTION_NEEDED", nothing else.
                     if not all_success:
                         break
             
+            # Stop the model stream behind commands the loop left early
+            if not isinstance(commands, list):
+                commands.close()
+            
             # Complete or fail the subtask
             if all_success:
                 self.context.complete_current_task("Completed successfully")
@@ -1773,48 +2710,19 @@ Return ONLY the question text or "NO_QUESTION_NEEDED", nothing else.
                 
                 # Check if we should continue to next subtask
                 if i < len(task_plan['subtasks']):
-                    # Let Gemini decide if we should continue
-                    prompt = f"""
-# SUBTASK CONTINUATION DECISION
-
-Current subtask failed but there are more subtasks available.
-Should we continue to the next subtask?
-
-Context:
-- Failed Subtask: {subtask['description']}
-- Next Subtask: {task_plan['subtasks'][i]['description']}
-- System State: {system_state}
-
-Return a JSON object with this structure:
-{{
-    "should_continue": true/false,
-    "reason": "why we should or shouldn't continue"
-}}
-"""
-                    try:
-                        response = MODEL.generate_content(prompt)
-                        text = response.text.strip()
-                        
-                        # Extract JSON from response
-                        match = re.search(r'```json\s*({.*?})\s*```', text, re.DOTALL)
-                        if match:
-                            json_str = match.group(1)
-                        else:
-                            match = re.search(r'({.*})', text, re.DOTALL)
-                            if match:
-                                json_str = match.group(1)
-                            else:
-                                json_str = text
-                        
-                        decision = json.loads(json_str)
-                        if not decision.get("should_continue", False):
-                            print(f"{Fore.RED}Task aborted: {decision.get('reason', 'Unknown reason')}{Style.RESET_ALL}")
-                            return
-                        else:
-                            print(f"{Fore.YELLOW}Continuing to next subtask: {decision.get('reason', '')}{Style.RESET_ALL}")
-                    except Exception as e:
-                        print(f"{Fore.RED}Error making continuation decision: {str(e)}{Style.RESET_ALL}")
+                    # The verification reply usually carries the decision already
+                    if "continue_plan" in next_action:
+                        decision = {"should_continue": next_action["continue_plan"],
+                                    "reason": next_action.get("continue_reason", "")}
+                    else:
+                        decision = self.get_continuation_decision(subtask['description'], next_subtask, system_state)
+                    if decision is None:
+                        return
+                    if not decision.get("should_continue", False):
+                        print(f"{Fore.RED}Task aborted: {decision.get('reason', 'Unknown reason')}{Style.RESET_ALL}")
                         return
+                    else:
+                        print(f"{Fore.YELLOW}Continuing to next subtask: {decision.get('reason', '')}{Style.RESET_ALL}")
             
             # Check if main task objective has been achieved after subtask
             if main_task_objective_achieved:
@@ -1822,53 +2730,6 @@ Return a JSON object with this structure:
                 print(f"{Fore.YELLOW}Remaining subtasks are no longer necessary. Ending task.{Style.RESET_ALL}")
                 break
                 
-            # After each subtask, if this is a verification task, check if we need to continue
-            if is_check_installation and i < len(task_plan['subtasks']) and all_success:
-                evaluate_prompt = f"""
-# TASK CONTINUATION EVALUATION
-
-Evaluate if the main task objective has been achieved and we should stop execution.
-
-Context:
-- Main Task: {task}
-- Current Subtask: {subtask['description']}
-- Subtask Result: {"Success" if all_success else "Failed"}
-- System State: {system_state}
-- Command Output: {result.get('stdout', '')}
-
-Return a JSON object with this structure:
-{{
-    "is_complete": true/false,
-    "reason": "explanation why the task is complete or needs to continue",
-    "result": "summary of findings so far"
-}}
-"""
-                try:
-                    response = MODEL.generate_content(evaluate_prompt)
-                    text = response.text.strip()
-                    
-                    # Extract JSON from response
-                    match = re.search(r'```json\s*({.*?})\s*```', text, re.DOTALL)
-                    if match:
-                        json_str = match.group(1)
-                    else:
-                        match = re.search(r'({.*})', text, re.DOTALL)
-                        if match:
-                            json_str = match.group(1)
-                        else:
-                            json_str = text
-                    
-                    evaluation = json.loads(json_str)
-                    if evaluation.get("is_complete", False):
-                        main_task_objective_achieved = True
-                        main_task_result = evaluation.get("result", "Task complete")
-                        print(f"\n{Fore.GREEN}Main task objective achieved: {main_task_result}{Style.RESET_ALL}")
-                        print(f"{Fore.YELLOW}Reason: {evaluation.get('reason', '')}{Style.RESET_ALL}")
-                        print(f"{Fore.YELLOW}Remaining subtasks are no longer necessary. Ending task.{Style.RESET_ALL}")
-                        break
-                except Exception as e:
-                    print(f"{Fore.YELLOW}Error evaluating task completion: {str(e)}{Style.RESET_ALL}")
-        
         # Complete the main task
         if main_task_objective_achieved:
             print(f"\n{Fore.GREEN}Task completed: {task}{Style.RESET_ALL}")
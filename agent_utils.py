@@ -6,38 +6,43 @@ import os
 import re
 import sys
 import platform
+import shutil
+import functools
 import subprocess
 from typing import List, Dict, Optional, Tuple, Set, Any
 
+# The platform never changes while the process runs, so look it up once
+_OS_SYSTEM = platform.system()
+_OS_RELEASE = platform.release()
+_OS_SYSTEM_LOWER = _OS_SYSTEM.lower()
+
 class PlatformUtils:
     """Utilities for platform-specific operations and detection"""
     
     @staticmethod
     def is_windows() -> bool:
         """Check if running on Windows"""
-        return platform.system().lower() == "windows"
+        return _OS_SYSTEM_LOWER == "windows"
     
     @staticmethod
     def is_linux() -> bool:
         """Check if running on Linux"""
-        return platform.system().lower() == "linux"
+        return _OS_SYSTEM_LOWER == "linux"
     
     @staticmethod
     def is_macos() -> bool:
         """Check if running on macOS"""
-        return platform.system().lower() == "darwin"
+        return _OS_SYSTEM_LOWER == "darwin"
     
     @staticmethod
+    @functools.lru_cache(maxsize=None)
     def get_shell() -> str:
-        """Get the current shell"""
+        """Get the current shell (resolved once per process)"""
         if PlatformUtils.is_windows():
-            # Check if PowerShell is available
-            try:
-                subprocess.run(["powershell", "-Command", "echo 1"], 
-                              stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            # Check if PowerShell is available without paying for a PowerShell startup
+            if shutil.which("powershell"):
                 return "powershell"
-            except:
-                return "cmd"
+            return "cmd"
         else:
             # Unix-like systems
             return os.environ.get("SHELL", "/bin/bash").split("/")[-1]
@@ -46,8 +51,8 @@ class PlatformUtils:
     def get_platform_info() -> Dict[str, str]:
         """Get detailed platform information"""
         info = {
-            "system": platform.system(),
-            "release": platform.release(),
+            "system": _OS_SYSTEM,
+            "release": _OS_RELEASE,
             "version": platform.version(),
             "machine": platform.machine(),
             "processor": platform.processor(),
@@ -61,7 +66,7 @@ class PlatformUtils:
             try:
                 # Get Windows edition
                 edition = subprocess.check_output(
-                    ["powershell", "-Command", "(Get-WmiObject -Class Win32_OperatingSystem).Caption"], 
+                    ["powershell", "-NoProfile", "-NonInteractive", "-Command", "(Get-WmiObject -Class Win32_OperatingSystem).Caption"], 
                     text=True
                 ).strip()
                 info["edition"] = edition
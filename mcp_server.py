@@ -4,18 +4,46 @@ Model Context Protocol (MCP) Server
 Handles system operations and queries for the AI agent
 """
 import os
+import re
 import json
+import errno
+import shutil
 import platform
+import time
+import functools
 import subprocess
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime
-import win32api
-import win32con
-import win32file
-import win32security
-import win32com.client
 from pathlib import Path
 
+_HOME_DIR = os.path.expanduser("~")
+
+# Seconds a package lookup is trusted; winget has no cheap change marker like Chocolatey's lib folder
+PACKAGE_INFO_TTL = 300
+
+# File extension -> folder a file of that type is sorted into; anything else goes to "Others"
+EXT_TO_FOLDER = {
+    **dict.fromkeys(('.jpg', '.jpeg', '.png', '.gif', '.bmp'), "Images"),
+    **dict.fromkeys(('.mp4', '.avi', '.mov', '.wmv'), "Videos"),
+    **dict.fromkeys(('.mp3', '.wav', '.flac'), "Music"),
+    **dict.fromkeys(('.pdf', '.doc', '.docx', '.txt'), "Documents"),
+    **dict.fromkeys(('.zip', '.rar', '.7z'), "Archives")
+}
+SORT_FOLDERS = ("Images", "Videos", "Music", "Documents", "Archives", "Others")
+
+@functools.lru_cache(maxsize=64)
+def _which(name: str) -> Optional[str]:
+    """Locate an executable on PATH, remembering the answer for the rest of the session"""
+    return shutil.which(name)
+
+def _choco_lib_mtime() -> float:
+    """Modification time of Chocolatey's package folder, which changes whenever a package is (un)installed"""
+    choco_dir = os.environ.get("ChocolateyInstall", "C:\\ProgramData\\chocolatey")
+    try:
+        return os.stat(os.path.join(choco_dir, "lib")).st_mtime
+    except OSError:
+        return 0.0
+
 class MCPServer:
     """Server to handle system operations and queries"""
     
@@ -24,6 +52,8 @@ class MCPServer:
         self.package_managers = self._check_package_managers()
         self.drive_info = self._get_drive_info()
         self.common_dirs = self._get_common_dirs()
+        # package name -> (Chocolatey lib mtime, monotonic expiry, info)
+        self._package_info_cache: Dict[str, Tuple[float, float, Dict]] = {}
         
     def _get_system_info(self) -> Dict:
         """Get basic system information"""
@@ -38,46 +68,30 @@ class MCPServer:
     
     def _check_package_managers(self) -> Dict:
         """Check for installed package managers"""
-        managers = {
-            "chocolatey": False,
-            "winget": False,
-            "scoop": False
+        # A PATH lookup is enough to know a manager is there; no need to start each one
+        return {
+            "chocolatey": _which("choco") is not None,
+            "winget": _which("winget") is not None,
+            "scoop": _which("scoop") is not None
         }
-        
-        # Check Chocolatey
-        try:
-            subprocess.run(["choco", "-v"], capture_output=True, check=True)
-            managers["chocolatey"] = True
-        except:
-            pass
-            
-        # Check Winget
-        try:
-            subprocess.run(["winget", "--version"], capture_output=True, check=True)
-            managers["winget"] = True
-        except:
-            pass
-            
-        # Check Scoop
-        try:
-            subprocess.run(["scoop", "--version"], capture_output=True, check=True)
-            managers["scoop"] = True
-        except:
-            pass
-            
-        return managers
     
     def _get_drive_info(self) -> Dict:
         """Get information about system drives"""
         drive_info = {}
         try:
-            drives = win32api.GetLogicalDriveStrings().split('\000')[:-1]
+            # Imported here so the module loads without pywin32 (the fallback below covers that)
+            import win32api
+            # Drive letters come from a bitmask, bit 0 being A:
+            drive_mask = win32api.GetLogicalDrives()
+            drives = [f"{chr(65 + i)}:\\" for i in range(26) if drive_mask & (1 << i)]
             for drive in drives:
                 try:
+                    # One call per drive returns both sizes as 64-bit byte counts
+                    _, total_space, free_space = win32api.GetDiskFreeSpaceEx(drive)
                     drive_info[drive] = {
                         "type": "fixed" if drive.startswith("C:") else "removable",
-                        "free_space": win32api.GetDiskFreeSpace(drive)[0] * win32api.GetDiskFreeSpace(drive)[1] * win32api.GetDiskFreeSpace(drive)[2],
-                        "total_space": win32api.GetDiskFreeSpace(drive)[0] * win32api.GetDiskFreeSpace(drive)[1] * win32api.GetDiskFreeSpace(drive)[3]
+                        "free_space": free_space,
+                        "total_space": total_space
                     }
                 except:
                     drive_info[drive] = {"type": "available"}
@@ -95,14 +109,14 @@ class MCPServer:
         return {
             "Program Files": os.path.join(os.environ.get("ProgramFiles", "C:\\Program Files")),
             "Program Files (x86)": os.path.join(os.environ.get("ProgramFiles(x86)", "C:\\Program Files (x86)")),
-            "AppData": os.path.join(os.environ.get("APPDATA", os.path.expanduser("~\\AppData\\Roaming"))),
-            "Local AppData": os.path.join(os.environ.get("LOCALAPPDATA", os.path.expanduser("~\\AppData\\Local"))),
-            "Downloads": os.path.join(os.path.expanduser("~"), "Downloads"),
-            "Desktop": os.path.join(os.path.expanduser("~"), "Desktop"),
-            "Documents": os.path.join(os.path.expanduser("~"), "Documents"),
-            "Pictures": os.path.join(os.path.expanduser("~"), "Pictures"),
-            "Videos": os.path.join(os.path.expanduser("~"), "Videos"),
-            "Music": os.path.join(os.path.expanduser("~"), "Music")
+            "AppData": os.path.join(os.environ.get("APPDATA", os.path.join(_HOME_DIR, "AppData", "Roaming"))),
+            "Local AppData": os.path.join(os.environ.get("LOCALAPPDATA", os.path.join(_HOME_DIR, "AppData", "Local"))),
+            "Downloads": os.path.join(_HOME_DIR, "Downloads"),
+            "Desktop": os.path.join(_HOME_DIR, "Desktop"),
+            "Documents": os.path.join(_HOME_DIR, "Documents"),
+            "Pictures": os.path.join(_HOME_DIR, "Pictures"),
+            "Videos": os.path.join(_HOME_DIR, "Videos"),
+            "Music": os.path.join(_HOME_DIR, "Music")
         }
     
     def get_folder_structure(self, path: str, max_depth: int = 3) -> Dict:
@@ -183,18 +197,8 @@ class MCPServer:
                             analysis["file_types"][file_ext] = analysis["file_types"].get(file_ext, 0) + 1
                             
                         # Suggest folders based on file types
-                        if file_ext in ['.jpg', '.jpeg', '.png', '.gif', '.bmp']:
-                            analysis["suggested_folders"]["Images"] = analysis["suggested_folders"].get("Images", 0) + 1
-                        elif file_ext in ['.mp4', '.avi', '.mov', '.wmv']:
-                            analysis["suggested_folders"]["Videos"] = analysis["suggested_folders"].get("Videos", 0) + 1
-                        elif file_ext in ['.mp3', '.wav', '.flac']:
-                            analysis["suggested_folders"]["Music"] = analysis["suggested_folders"].get("Music", 0) + 1
-                        elif file_ext in ['.pdf', '.doc', '.docx', '.txt']:
-                            analysis["suggested_folders"]["Documents"] = analysis["suggested_folders"].get("Documents", 0) + 1
-                        elif file_ext in ['.zip', '.rar', '.7z']:
-                            analysis["suggested_folders"]["Archives"] = analysis["suggested_folders"].get("Archives", 0) + 1
-                        else:
-                            analysis["suggested_folders"]["Others"] = analysis["suggested_folders"].get("Others", 0) + 1
+                        folder = EXT_TO_FOLDER.get(file_ext, "Others")
+                        analysis["suggested_folders"][folder] = analysis["suggested_folders"].get(folder, 0) + 1
                             
                     except:
                         continue
@@ -216,7 +220,14 @@ class MCPServer:
     def move_file(self, source: str, destination: str) -> bool:
         """Move a file to a new location"""
         try:
-            os.rename(source, destination)
+            try:
+                # A rename only touches directory entries, so it is instant on one filesystem
+                os.rename(source, destination)
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                # Across filesystems the data has to be copied
+                shutil.move(source, destination)
             return True
         except Exception as e:
             print(f"Error moving file {source}: {str(e)}")
@@ -246,6 +257,9 @@ class MCPServer:
                 # Download and run Chocolatey installation script
                 script = "Set-ExecutionPolicy Bypass -Scope Process -Force; [System.Net.ServicePointManager]::SecurityProtocol = [System.Net.ServicePointManager]::SecurityProtocol -bor 3072; iex ((New-Object System.Net.WebClient).DownloadString('https://community.chocolatey.org/install.ps1'))"
                 subprocess.run(["powershell", "-Command", script], check=True)
+                # PATH lookups made before the install are now stale
+                _which.cache_clear()
+                self.package_managers["chocolatey"] = True
                 return True
             except Exception as e:
                 print(f"Error installing Chocolatey: {str(e)}")
@@ -254,6 +268,17 @@ class MCPServer:
     
     def get_package_info(self, package_name: str) -> Dict:
         """Get information about a package"""
+        # Reuse the last answer until Chocolatey's package folder changes or the TTL runs out
+        choco_mtime = _choco_lib_mtime()
+        now = time.monotonic()
+        cached = self._package_info_cache.get(package_name)
+        if cached is None or cached[0] != choco_mtime or cached[1] <= now:
+            cached = (choco_mtime, now + PACKAGE_INFO_TTL, self._query_package_info(package_name))
+            self._package_info_cache[package_name] = cached
+        return dict(cached[2])
+    
+    def _query_package_info(self, package_name: str) -> Dict:
+        """Ask the package managers whether a package is installed"""
         info = {
             "is_installed": False,
             "version": None,
@@ -291,5 +316,7 @@ class MCPServer:
                 
         return info
 
-# Create a singleton instance
-mcp = MCPServer() 
\ No newline at end of file
+@functools.lru_cache(maxsize=None)
+def get_mcp() -> MCPServer:
+    """Create the shared server on first use, since probing package managers and drives is slow"""
+    return MCPServer()
\ No newline at end of file
@@ -7,18 +7,21 @@ import os
 import sys
 import platform
 import argparse
+import importlib.util
 
 def check_dependencies():
     """Check if required dependencies are installed"""
-    try:
-        import google.generativeai
-        import yaml
-        import colorama
-        return True
-    except ImportError as e:
-        print(f"Missing dependency: {e}")
-        print("Please install required dependencies: pip install -r requirements.txt")
-        return False
+    # Locate the packages without importing them; the agent imports them when first needed
+    for module in ("google.generativeai", "yaml", "colorama"):
+        try:
+            found = importlib.util.find_spec(module) is not None
+        except ImportError:
+            found = False
+        if not found:
+            print(f"Missing dependency: No module named '{module}'")
+            print("Please install required dependencies: pip install -r requirements.txt")
+            return False
+    return True
 
 def check_api_key():
     """Check if the API key is available"""
@@ -0,0 +1,124 @@
+"""Tests for loading, appending and compacting the command history file"""
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import agent_terminal
+from agent_terminal import AgentTerminal
+
+
+def make_agent(history_file: str, max_history: int = 100) -> AgentTerminal:
+    """Create an agent that only has what the history methods use, then load the file"""
+    agent = AgentTerminal.__new__(AgentTerminal)
+    agent.config = {"history_file": history_file, "max_history": max_history}
+    agent.silent_init = True
+    agent.load_history()
+    return agent
+
+
+def read_lines(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+class HistoryTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        self.history_file = os.path.join(self.dir, "command_history.jsonl")
+
+    def write(self, path: str, data: bytes):
+        with open(path, "wb") as f:
+            f.write(data)
+
+    def test_legacy_json_file_is_migrated(self):
+        legacy = os.path.join(self.dir, "command_history.json")
+        with open(legacy, "w") as f:
+            json.dump(["ls", "pwd"], f, indent=2)
+
+        agent = make_agent(self.history_file)
+        self.assertEqual(agent.command_history, ["ls", "pwd"])
+        self.assertEqual(read_lines(self.history_file), ["ls", "pwd"])
+
+        agent.command_history.append("whoami")
+        agent.save_history()
+        self.assertEqual(read_lines(self.history_file), ["ls", "pwd", "whoami"])
+        self.assertEqual(make_agent(self.history_file).command_history, ["ls", "pwd", "whoami"])
+
+    def test_legacy_array_under_configured_name_is_rewritten(self):
+        self.write(self.history_file, b'[\n  "ls",\n  "pwd"\n]')
+
+        agent = make_agent(self.history_file)
+        self.assertEqual(agent.command_history, ["ls", "pwd"])
+        self.assertEqual(read_lines(self.history_file), ["ls", "pwd"])
+
+    def test_corrupt_line_is_skipped_and_file_repaired(self):
+        self.write(self.history_file, b'"ls"\n{not json\n"pwd"\n"who')
+
+        agent = make_agent(self.history_file)
+        self.assertEqual(agent.command_history, ["ls", "pwd"])
+        self.assertFalse(agent._history_locked)
+        # The damaged lines are gone before anything is appended
+        self.assertEqual(read_lines(self.history_file), ["ls", "pwd"])
+
+        agent.command_history.append("date")
+        agent.save_history()
+        self.assertEqual(read_lines(self.history_file), ["ls", "pwd", "date"])
+
+    def test_corrupt_line_locks_appends_when_repair_fails(self):
+        damaged = b'"ls"\n{not json\n"pwd"\n'
+        self.write(self.history_file, damaged)
+
+        with mock.patch.object(agent_terminal.os, "replace", side_effect=OSError("read-only")):
+            agent = make_agent(self.history_file)
+        self.assertEqual(agent.command_history, ["ls", "pwd"])
+        self.assertTrue(agent._history_locked)
+
+        agent.command_history.append("date")
+        agent.save_history()
+        self.assertFalse(agent.compact_history())
+        with open(self.history_file, "rb") as f:
+            self.assertEqual(f.read(), damaged)
+
+    def test_unreadable_file_locks_history(self):
+        os.mkdir(self.history_file)
+
+        agent = make_agent(self.history_file)
+        self.assertEqual(agent.command_history, [])
+        self.assertTrue(agent._history_locked)
+
+        agent.command_history.append("ls")
+        agent.save_history()
+        self.assertTrue(os.path.isdir(self.history_file))
+
+    def test_compaction_on_load_keeps_the_tail(self):
+        self.write(self.history_file, b"".join(f'"cmd{i}"\n'.encode() for i in range(7)))
+
+        agent = make_agent(self.history_file, max_history=3)
+        self.assertEqual(agent.command_history, ["cmd4", "cmd5", "cmd6"])
+        self.assertEqual(read_lines(self.history_file), ["cmd4", "cmd5", "cmd6"])
+
+    def test_compaction_after_save_keeps_the_tail(self):
+        agent = make_agent(self.history_file, max_history=3)
+        for i in range(6):
+            agent.command_history.append(f"cmd{i}")
+            agent.save_history()
+        # Six entries is exactly twice the limit, so the file has only been appended to
+        self.assertEqual(len(read_lines(self.history_file)), 6)
+
+        agent.command_history.append("cmd6")
+        agent.save_history()
+        self.assertEqual(read_lines(self.history_file), ["cmd4", "cmd5", "cmd6"])
+        self.assertEqual(agent.command_history, ["cmd4", "cmd5", "cmd6"])
+
+        agent.command_history.append("cmd7")
+        agent.save_history()
+        self.assertEqual(make_agent(self.history_file, max_history=3).command_history,
+                         ["cmd4", "cmd5", "cmd6", "cmd7"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+"""Tests for parse_json_response on the shapes of reply the model actually sends"""
+import unittest
+from unittest import mock
+
+import agent_terminal
+from agent_terminal import parse_json_response
+
+
+class ParseJsonResponseTest(unittest.TestCase):
+    def test_bare_object(self):
+        self.assertEqual(parse_json_response('{"success": true}'), {"success": True})
+
+    def test_surrounding_whitespace(self):
+        self.assertEqual(parse_json_response('\n  {"a": 1}\n\n'), {"a": 1})
+
+    def test_json_fence(self):
+        text = 'Here is the plan:\n```json\n{"task_summary": "t", "subtasks": []}\n```\n'
+        self.assertEqual(parse_json_response(text), {"task_summary": "t", "subtasks": []})
+
+    def test_brace_before_fence_is_ignored(self):
+        text = 'Use {placeholders} as needed.\n```json\n{"a": 1}\n```'
+        self.assertEqual(parse_json_response(text), {"a": 1})
+
+    def test_prose_prefix(self):
+        self.assertEqual(parse_json_response('Sure! The result is {"a": [1, 2]}'), {"a": [1, 2]})
+
+    def test_trailing_text(self):
+        self.assertEqual(parse_json_response('{"a": 1}\nLet me know if you need more.'), {"a": 1})
+
+    def test_stray_brace_in_preamble(self):
+        self.assertEqual(parse_json_response('Result {not json} follows: {"ok": true}'), {"ok": True})
+
+    def test_first_of_two_objects(self):
+        # Starts and ends with a brace but is not one object, so the fast path must fall through
+        self.assertEqual(parse_json_response('{"a": 1} and {"b": 2}'), {"a": 1})
+
+    def test_braces_inside_strings(self):
+        text = 'Answer: {"command": "echo }{", "nested": {"x": "{"}}'
+        self.assertEqual(parse_json_response(text), {"command": "echo }{", "nested": {"x": "{"}})
+
+    def test_malformed_object_raises(self):
+        with self.assertRaises(ValueError):
+            parse_json_response('{"success": true, "system_state": ')
+
+    def test_no_json_raises(self):
+        with self.assertRaises(ValueError):
+            parse_json_response("I could not verify that command.")
+
+
+class ParseJsonResponseStdlibTest(ParseJsonResponseTest):
+    """The same cases when orjson is not installed"""
+
+    def setUp(self):
+        patcher = mock.patch.object(agent_terminal, "HAS_ORJSON", False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+if __name__ == "__main__":
+    unittest.main()